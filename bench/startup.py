@@ -0,0 +1,122 @@
+"""Measure how long the Bril tools take to start up.
+
+Each entry point runs in a fresh interpreter on a tiny program, so the
+time is almost all startup: launching Python and importing modules. For
+every entry point, this reports the median wall-clock time over several
+runs, the time spent importing (according to `python3 -X importtime`),
+and whether the text format parser's `lark` dependency was loaded.
+
+    python3 bench/startup.py [-n RUNS] [--check]
+
+With `--check`, exit with an error if any entry point other than
+`bril2json` loads `lark`.
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EXAMPLES = os.path.join(ROOT, 'examples')
+
+PROGRAM_TXT = b"""
+main {
+  v0: int = const 1;
+  v1: int = const 2;
+  v2: int = add v0 v1;
+  print v2;
+}
+"""
+
+PROGRAM_JSON = b"""
+{"functions": [{"name": "main", "instrs": [
+  {"op": "const", "type": "int", "dest": "v0", "value": 1},
+  {"op": "const", "type": "int", "dest": "v1", "value": 2},
+  {"op": "add", "type": "int", "dest": "v2", "args": ["v0", "v1"]},
+  {"op": "print", "args": ["v2"]}
+]}]}
+"""
+
+
+def example(name, *args):
+    return [os.path.join(EXAMPLES, name)] + list(args)
+
+
+# The entry points: a name, the arguments to Python, the input, and
+# whether the entry point parses the text format.
+ENTRY_POINTS = [
+    ('bril2json', ['-c', 'import briltxt; briltxt.bril2json()'],
+     PROGRAM_TXT, True),
+    ('bril2txt', ['-c', 'import briltxt; briltxt.bril2txt()'],
+     PROGRAM_JSON, False),
+    ('form_blocks', example('form_blocks.py'), PROGRAM_JSON, False),
+    ('cfg_dot', example('cfg_dot.py', '-v'), PROGRAM_JSON, False),
+    ('dom', example('dom.py'), PROGRAM_JSON, False),
+    ('df', example('df.py', 'live'), PROGRAM_JSON, False),
+    ('tdce', example('tdce.py'), PROGRAM_JSON, False),
+    ('lvn', example('lvn.py'), PROGRAM_JSON, False),
+    ('sccp', example('sccp.py'), PROGRAM_JSON, False),
+    ('layout', example('layout.py'), PROGRAM_JSON, False),
+    ('csr', example('csr.py'), PROGRAM_JSON, False),
+]
+
+
+def run(args, data, importtime=False):
+    """Run Python with some arguments and input. Return the wall-clock
+    time and the standard error output.
+    """
+    cmd = [sys.executable] + (['-X', 'importtime'] if importtime else [])
+    start = time.perf_counter()
+    proc = subprocess.run(cmd + args, input=data, stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE, check=True)
+    return time.perf_counter() - start, proc.stderr.decode('utf8')
+
+
+def import_stats(log):
+    """Given the `-X importtime` output, get the total import time in
+    seconds and the set of imported module names.
+    """
+    total = 0
+    modules = set()
+    for line in log.splitlines():
+        if not line.startswith('import time:') or '[us]' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        modules.add(name.strip())
+        if not name[1:].startswith(' '):  # A top-level import.
+            total += int(cumulative)
+    return total / 1e6, modules
+
+
+def bench(runs):
+    """Measure every entry point. Produce a list of (name, wall time,
+    import time, loads lark, parses) tuples.
+    """
+    results = []
+    for name, args, data, parses in ENTRY_POINTS:
+        times = [run(args, data)[0] for _ in range(runs)]
+        imports, modules = import_stats(run(args, data, True)[1])
+        results.append((name, statistics.median(times), imports,
+                        'lark' in modules, parses))
+    return results
+
+
+if __name__ == '__main__':
+    runs = 5
+    if '-n' in sys.argv:
+        runs = int(sys.argv[sys.argv.index('-n') + 1])
+
+    results = bench(runs)
+    print('{:<12} {:>9} {:>9}  {}'.format('tool', 'wall ms', 'import ms',
+                                          'lark'))
+    for name, wall, imports, lark, _ in results:
+        print('{:<12} {:>9.1f} {:>9.1f}  {}'.format(
+            name, wall * 1000, imports * 1000, 'yes' if lark else 'no',
+        ))
+
+    if '--check' in sys.argv:
+        bad = [r[0] for r in results if r[3] and not r[4]]
+        if bad:
+            sys.exit('loads lark without parsing: {}'.format(', '.join(bad)))
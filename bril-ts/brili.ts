@@ -296,12 +296,17 @@ function evalInstr(instr: bril.Instruction, env: Env): Action {
   throw `unhandled opcode ${(instr as any).op}`;
 }
 
-function evalFunc(func: bril.Function) {
+/**
+ * Run a function. Return the number of instructions executed.
+ */
+function evalFunc(func: bril.Function): number {
   let env: Env = new Map();
+  let icount = 0;
   for (let i = 0; i < func.instrs.length; ++i) {
     let line = func.instrs[i];
     if ('op' in line) {
       let action = evalInstr(line, env);
+      ++icount;
 
       if ('label' in action) {
         // Search for the label and transfer control.
@@ -315,23 +320,31 @@ function evalFunc(func: bril.Function) {
           throw `label ${action.label} not found`;
         }
       } else if ('end' in action) {
-        return;
+        return icount;
       }
     }
   }
+  return icount;
 }
 
-function evalProg(prog: bril.Program) {
+/**
+ * Run the program. With `profile`, print the number of instructions
+ * executed (the dynamic instruction count) to stderr at the end.
+ */
+function evalProg(prog: bril.Program, profile: boolean) {
   for (let func of prog.functions) {
     if (func.name === "main") {
-      evalFunc(func);
+      let icount = evalFunc(func);
+      if (profile) {
+        console.error(`total_dyn_inst: ${icount}`);
+      }
     }
   }
 }
 
 async function main() {
   let prog = JSON.parse(await readStdin()) as bril.Program;
-  evalProg(prog);
+  evalProg(prog, process.argv.includes('-p'));
 }
 
 // Make unhandled promise rejections terminate.
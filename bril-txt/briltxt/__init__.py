@@ -0,0 +1,164 @@
+"""A text format for Bril.
+
+This module defines both a parser and a pretty-printer for a
+human-editable representation of Bril programs. There are two commands:
+`bril2txt`, which takes a Bril program in its (canonical) JSON format and
+pretty-prints it in the text format, and `bril2json`, which parses the
+format and emits the ordinary JSON representation.
+
+The parser lives in the `briltxt.parse` submodule, which is only loaded
+when something is parsed: it depends on `lark`, which is slow to import,
+and most uses (printing, and the JSON functions the other tools use)
+don't need it.
+"""
+
+import os
+import sys
+import json
+
+__version__ = '0.0.1'
+
+
+# JSON input and output.
+#
+# All the tools read and write Bril JSON through these functions. They
+# use a faster JSON library when one is installed (`orjson` or `ujson`).
+# By default, output is indented with sorted keys, which is stable and
+# easy to read (and what the tests expect). Setting the `BRIL_COMPACT`
+# environment variable to a nonempty value selects a compact, unsorted
+# form that is much faster to produce and to parse, for passing programs
+# between tools.
+
+try:
+    import orjson as _fastjson
+except ImportError:
+    try:
+        import ujson as _fastjson
+    except ImportError:
+        _fastjson = None
+
+
+def compact_default():
+    return bool(os.environ.get('BRIL_COMPACT'))
+
+
+def loads(data):
+    """Parse JSON from a string or bytes.
+    """
+    if _fastjson is not None:
+        return _fastjson.loads(data)
+    return json.loads(data)
+
+
+def load(fp):
+    """Parse JSON from a file. Text files are read through their
+    underlying binary buffer when they have one.
+    """
+    return loads(getattr(fp, 'buffer', fp).read())
+
+
+def dumps(obj, compact=None):
+    """Serialize a value to a JSON string. The output is compact if
+    `compact` is true or, when it is None, if `BRIL_COMPACT` is set.
+    """
+    if compact is None:
+        compact = compact_default()
+    if not compact:
+        return json.dumps(obj, indent=2, sort_keys=True)
+    elif _fastjson is not None and _fastjson.__name__ == 'orjson':
+        return _fastjson.dumps(obj).decode('utf8')
+    elif _fastjson is not None:
+        return _fastjson.dumps(obj)
+    else:
+        return json.dumps(obj, separators=(',', ':'))
+
+
+def dump(obj, fp, compact=None):
+    """Serialize a value as JSON to a file.
+    """
+    fp.write(dumps(obj, compact))
+
+
+# Text format parser. These load `briltxt.parse` on first use.
+
+def get_parser():
+    """Get the text format parser, building it on first use. Building
+    the parser is slow, so long-running processes reuse it.
+    """
+    from .parse import get_parser
+    return get_parser()
+
+
+def parse_funcs(txt):
+    """Parse text into a list of Bril functions.
+    """
+    from .parse import parse_funcs
+    return parse_funcs(txt)
+
+
+def parse_bril(txt, jobs=1):
+    """Parse text into a Bril program as a JSON string, optionally in
+    `jobs` processes.
+    """
+    from .parse import parse_bril
+    return parse_bril(txt, jobs)
+
+
+# Text format pretty-printer.
+
+def instr_to_string(instr):
+    if instr['op'] == 'const':
+        return '{}: {} = const {}'.format(
+            instr['dest'],
+            instr['type'],
+            str(instr['value']).lower(),
+        )
+    elif 'dest' in instr:
+        return '{}: {} = {} {}'.format(
+            instr['dest'],
+            instr['type'],
+            instr['op'],
+            ' '.join(instr['args']),
+        )
+    else:
+        return '{} {}'.format(
+            instr['op'],
+            ' '.join(instr['args']),
+        )
+
+
+def print_instr(instr):
+    print('  {};'.format(instr_to_string(instr)))
+
+
+def print_label(label):
+    print('{}:'.format(label['label']))
+
+
+def print_func(func):
+    print('{} {{'.format(func['name']))
+    for instr_or_label in func['instrs']:
+        if 'label' in instr_or_label:
+            print_label(instr_or_label)
+        else:
+            print_instr(instr_or_label)
+    print('}')
+
+
+def print_prog(prog):
+    for func in prog['functions']:
+        print_func(func)
+
+
+# Command-line entry points.
+
+def bril2json():
+    # With `-j N`, parse in N processes.
+    jobs = 1
+    if '-j' in sys.argv:
+        jobs = int(sys.argv[sys.argv.index('-j') + 1])
+    print(parse_bril(sys.stdin.read(), jobs))
+
+
+def bril2txt():
+    print_prog(load(sys.stdin))
@@ -0,0 +1,179 @@
+"""The parser for the Bril text format, built with `lark`.
+"""
+
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+import lark
+
+from . import dumps
+
+GRAMMAR = """
+start: func*
+
+func: CNAME "{" instr* "}"
+
+?instr: const | vop | eop | label
+
+const.4: IDENT ":" type "=" "const" lit ";"
+vop.3: IDENT ":" type "=" CNAME IDENT* ";"
+eop.2: CNAME IDENT* ";"
+label.1: IDENT ":"
+
+lit: SIGNED_INT  -> int
+  | BOOL     -> bool
+  | DECIMAL  -> double
+  | FLOAT  -> bril_float
+
+type: CNAME
+BOOL: "true" | "false"
+FLOAT: DECIMAL "f"
+IDENT: ("_"|"%"|LETTER) ("_"|"%"|"."|LETTER|DIGIT)*
+COMMENT: /#.*/
+
+%import common.SIGNED_INT
+%import common.DECIMAL
+%import common.WS
+%import common.CNAME
+%import common.LETTER
+%import common.DIGIT
+%ignore WS
+%ignore COMMENT
+""".strip()
+
+
+class JSONTransformer(lark.Transformer):
+    def start(self, items):
+        return {'functions': items}
+
+    def func(self, items):
+        name = items.pop(0)
+        return {'name': str(name), 'instrs': items}
+
+    def const(self, items):
+        dest = items.pop(0)
+        type = items.pop(0)
+        val = items.pop(0)
+        return {
+            'op': 'const',
+            'dest': str(dest),
+            'type': type,
+            'value': val,
+        }
+
+    def vop(self, items):
+        dest = items.pop(0)
+        type = items.pop(0)
+        op = items.pop(0)
+        return {
+            'op': str(op),
+            'dest': str(dest),
+            'type': type,
+            'args': [str(t) for t in items],
+         }
+
+    def eop(self, items):
+        op = items.pop(0)
+        return {
+            'op': str(op),
+            'args': [str(t) for t in items],
+         }
+
+    def label(self, items):
+        name = items.pop(0)
+        return {
+            'label': name,
+        }
+
+    def int(self, items):
+        return int(str(items[0]))
+
+    def bool(self, items):
+        if str(items[0]) == 'true':
+            return True
+        else:
+            return False
+
+    def double(self, items):
+        return float(str(items[0]))
+
+    def type(self, items):
+        return str(items[0])
+
+
+_parser = None
+
+
+def get_parser():
+    """Get the text format parser, building it on first use. Building
+    the parser is slow, so long-running processes reuse it.
+    """
+    global _parser
+    if _parser is None:
+        _parser = lark.Lark(GRAMMAR)
+    return _parser
+
+
+def parse_funcs(txt):
+    """Parse text into a list of Bril functions.
+    """
+    tree = get_parser().parse(txt)
+    return JSONTransformer().transform(tree)['functions']
+
+
+def _parse_chunk(txt):
+    # Parse errors can't be sent between processes, so just signal
+    # failure with None.
+    try:
+        return parse_funcs(txt)
+    except lark.exceptions.LarkError:
+        return None
+
+
+# Braces and comments: everything that matters for finding the end of a
+# function.
+SPLIT_TOKENS = re.compile(r'#[^\n]*|[{}]')
+
+# Don't bother splitting pieces of text smaller than this.
+MIN_CHUNK = 1 << 14
+
+
+def split_funcs(txt, count):
+    """Split text into about `count` pieces of similar size, cutting
+    only between top-level functions (after a closing brace outside of
+    any braces), so every piece can be parsed on its own.
+    """
+    size = max(len(txt) // count, MIN_CHUNK)
+    chunks = []
+    start = 0
+    depth = 0
+    for match in SPLIT_TOKENS.finditer(txt):
+        tok = match.group()
+        if tok == '{':
+            depth += 1
+        elif tok == '}':
+            depth -= 1
+            end = match.end()
+            if depth == 0 and end - start >= size:
+                chunks.append(txt[start:end])
+                start = end
+    chunks.append(txt[start:])
+    return chunks
+
+
+def parse_bril(txt, jobs=1):
+    """Parse text into a Bril program as a JSON string. With `jobs`
+    greater than one, split the text between functions and parse the
+    pieces in that many processes; the result is the same.
+    """
+    chunks = split_funcs(txt, jobs * 4) if jobs > 1 else [txt]
+    if len(chunks) == 1:
+        return dumps({'functions': parse_funcs(txt)})
+
+    with ProcessPoolExecutor(jobs, initializer=get_parser) as pool:
+        parts = list(pool.map(_parse_chunk, chunks))
+    if None in parts:
+        # Parse the whole text serially to report the error with its
+        # position in the file.
+        return dumps({'functions': parse_funcs(txt)})
+    return dumps({'functions': [f for part in parts for f in part]})
@@ -0,0 +1,340 @@
+"""A C backend for Bril.
+
+This module translates Bril programs from their JSON representation into
+C source code. Labels become `goto` targets and every Bril variable
+becomes a typed C local. The `bril2c` command prints the C code; `bril2c
+run` also compiles it with the system C compiler (`cc`, or `$CC`) and
+runs the result. Compiled binaries are cached by a hash of the generated
+code so running the same program again skips the compiler.
+"""
+
+import hashlib
+import json
+import os
+import string
+import subprocess
+import sys
+import tempfile
+
+__version__ = '0.0.1'
+
+# The range of Bril integers in compiled code.
+INT_MIN = -(1 << 63)
+INT_MAX = (1 << 63) - 1
+
+# C types for Bril types.
+TYPES = {
+    'int': 'int64_t',
+    'bool': 'bool',
+    'float': 'float',
+    'double': 'double',
+}
+
+# C expression templates for value operations.
+OPS = {
+    'add': '{0} + {1}',
+    'mul': '{0} * {1}',
+    'sub': '{0} - {1}',
+    'div': '{0} / {1}',
+    'eq': '{0} == {1}',
+    'lt': '{0} < {1}',
+    'gt': '{0} > {1}',
+    'le': '{0} <= {1}',
+    'ge': '{0} >= {1}',
+    'not': '!{0}',
+    'and': '{0} && {1}',
+    'or': '{0} || {1}',
+    'id': '{0}',
+    'fadd': '{0} + {1}',
+    'fmul': '{0} * {1}',
+    'fsub': '{0} - {1}',
+    'fdiv': '{0} / {1}',
+    'feq': '{0} == {1}',
+    'flt': '{0} < {1}',
+    'fle': '{0} <= {1}',
+    'fgt': '{0} > {1}',
+    'fge': '{0} >= {1}',
+}
+
+# Runtime support code. Floating-point values are printed the way
+# JavaScript formats numbers, so the output matches the reference
+# interpreter.
+PRELUDE = r"""
+#include <inttypes.h>
+#include <math.h>
+#include <stdbool.h>
+#include <stdint.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+static void print_sep(int first) {
+  if (!first) putchar(' ');
+}
+
+static void print_int(int64_t v) {
+  printf("%" PRId64, v);
+}
+
+static void print_bool(bool v) {
+  fputs(v ? "true" : "false", stdout);
+}
+
+static void print_double(double v) {
+  char buf[64], digits[32];
+  int prec, exp, k, n, i;
+
+  if (isnan(v)) { fputs("NaN", stdout); return; }
+  if (isinf(v)) { fputs(v < 0 ? "-Infinity" : "Infinity", stdout); return; }
+  if (v == 0) { putchar('0'); return; }
+  if (v < 0) { putchar('-'); v = -v; }
+
+  /* Find the shortest representation that reads back exactly. */
+  for (prec = 1; prec <= 17; ++prec) {
+    snprintf(buf, sizeof(buf), "%.*e", prec - 1, v);
+    if (strtod(buf, NULL) == v) break;
+  }
+
+  /* Split it into significant digits and an exponent. */
+  k = 0;
+  for (i = 0; buf[i] != 'e'; ++i) {
+    if (buf[i] != '.') digits[k++] = buf[i];
+  }
+  exp = atoi(buf + i + 1);
+  while (k > 1 && digits[k - 1] == '0') --k;
+  digits[k] = '\0';
+  n = exp + 1;
+
+  if (k <= n && n <= 21) {
+    fputs(digits, stdout);
+    for (i = k; i < n; ++i) putchar('0');
+  } else if (0 < n && n <= 21) {
+    printf("%.*s.%s", n, digits, digits + n);
+  } else if (-6 < n && n <= 0) {
+    fputs("0.", stdout);
+    for (i = n; i < 0; ++i) putchar('0');
+    fputs(digits, stdout);
+  } else {
+    putchar(digits[0]);
+    if (k > 1) printf(".%s", digits + 1);
+    printf("e%c%d", n - 1 < 0 ? '-' : '+', abs(n - 1));
+  }
+}
+""".lstrip()
+
+# Printing functions for each type.
+PRINTERS = {
+    'int': 'print_int',
+    'bool': 'print_bool',
+    'float': 'print_double',
+    'double': 'print_double',
+}
+
+
+def mangle(name, prefix):
+    """Turn a Bril identifier into a valid (and unique) C identifier.
+    Underscores are doubled and other non-alphanumeric characters are
+    replaced with their hexadecimal code.
+    """
+    out = []
+    for c in name:
+        if c == '_':
+            out.append('__')
+        elif c in string.ascii_letters or c in string.digits:
+            out.append(c)
+        else:
+            out.append('_{:02x}'.format(ord(c)))
+    return prefix + ''.join(out)
+
+
+def var(name):
+    return mangle(name, 'v_')
+
+
+def label(name):
+    return mangle(name, 'l_')
+
+
+def func_name(name):
+    return mangle(name, 'f_')
+
+
+def var_types(func):
+    """Map every variable in a function to its type. Raise a ValueError
+    if a variable is assigned values of different types.
+    """
+    types = {}
+    for instr in func['instrs']:
+        if 'dest' in instr:
+            dest, typ = instr['dest'], instr['type']
+            if types.setdefault(dest, typ) != typ:
+                raise ValueError('variable {} has types {} and {}'.format(
+                    dest, types[dest], typ,
+                ))
+            if typ not in TYPES:
+                raise ValueError('unsupported type {}'.format(typ))
+    return types
+
+
+def const_to_c(instr):
+    value = instr['value']
+    typ = instr['type']
+    if typ == 'bool':
+        return 'true' if value else 'false'
+    elif typ == 'int':
+        value = int(value // 1)
+        if not INT_MIN <= value <= INT_MAX:
+            raise ValueError(
+                'integer constant {} does not fit in 64 bits'.format(value)
+            )
+        elif value == INT_MIN:
+            return 'INT64_MIN'  # The literal for its negation overflows.
+        return 'INT64_C({})'.format(value)
+    else:
+        lit = repr(float(value))
+        if typ == 'float':
+            return '(float){}'.format(lit)
+        return lit
+
+
+def instr_to_c(instr, types):
+    """Produce a line of C code for a Bril instruction.
+    """
+    op = instr['op']
+    args = instr.get('args', [])
+
+    if op == 'const':
+        return '{} = {};'.format(var(instr['dest']), const_to_c(instr))
+    elif op in OPS:
+        expr = OPS[op].format(*(var(a) for a in args))
+        return '{} = {};'.format(var(instr['dest']), expr)
+    elif op == 'print':
+        parts = []
+        for i, arg in enumerate(args):
+            parts.append('print_sep({}); {}({});'.format(
+                int(i == 0), PRINTERS[types[arg]], var(arg),
+            ))
+        parts.append("putchar('\\n');")
+        return ' '.join(parts)
+    elif op == 'jmp':
+        return 'goto {};'.format(label(args[0]))
+    elif op == 'br':
+        return 'if ({}) goto {}; else goto {};'.format(
+            var(args[0]), label(args[1]), label(args[2]),
+        )
+    elif op == 'ret':
+        return 'return;'
+    elif op == 'nop':
+        return ';'
+    else:
+        raise ValueError('unknown opcode {}'.format(op))
+
+
+def func_to_c(func):
+    """Translate a Bril function into a C function definition.
+    """
+    types = var_types(func)
+    lines = ['static void {}(void) {{'.format(func_name(func['name']))]
+    for name, typ in sorted(types.items()):
+        lines.append('  {} {} = 0;'.format(TYPES[typ], var(name)))
+    for instr in func['instrs']:
+        if 'label' in instr:
+            lines.append('{}: ;'.format(label(instr['label'])))
+        else:
+            lines.append('  {}'.format(instr_to_c(instr, types)))
+    lines.append('}')
+    return '\n'.join(lines)
+
+
+def prog_to_c(prog):
+    """Translate a Bril program into a complete C program whose `main`
+    runs the Bril `main` function.
+    """
+    parts = [PRELUDE]
+    for func in prog['functions']:
+        parts.append(func_to_c(func))
+    main = [f['name'] for f in prog['functions'] if f['name'] == 'main']
+    parts.append('int main(void) {{\n{}  return 0;\n}}\n'.format(
+        ''.join('  {}();\n'.format(func_name(n)) for n in main),
+    ))
+    return '\n\n'.join(parts)
+
+
+# Compilation and execution.
+
+def cache_dir():
+    return os.environ.get(
+        'BRIL2C_CACHE',
+        os.path.join(os.path.expanduser('~'), '.cache', 'bril2c'),
+    )
+
+
+def compiler_version(cc):
+    """Get the output of `cc --version`, which identifies the compiler.
+    """
+    return subprocess.run(
+        [cc, '--version'], stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+    ).stdout.decode('utf8', 'replace')
+
+
+def compile_c(code):
+    """Compile a C program with the system compiler, reusing a cached
+    binary for identical code and the same compiler version. Return the
+    path to the executable.
+    """
+    cc = os.environ.get('CC', 'cc')
+    cmd = [cc, '-O2', '-fwrapv', '-x', 'c', '-', '-lm', '-o']
+
+    key = hashlib.sha256(
+        '\0'.join(cmd + [compiler_version(cc), code]).encode('utf8')
+    ).hexdigest()
+    path = os.path.join(cache_dir(), key)
+    if os.path.exists(path):
+        return path
+
+    # Build into a temporary file and move it into place, so concurrent
+    # runs never see a partially written binary.
+    os.makedirs(cache_dir(), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=cache_dir(), prefix='.tmp-')
+    os.close(fd)
+    try:
+        subprocess.run(cmd + [tmp], input=code.encode('utf8'), check=True)
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+    return path
+
+
+def run_c(code):
+    """Compile and run a C program, returning its exit status.
+    """
+    path = compile_c(code)
+    sys.stdout.flush()
+    return subprocess.run([path]).returncode
+
+
+def run_prog(prog):
+    """Compile and run a Bril program, returning its exit status.
+    """
+    return run_c(prog_to_c(prog))
+
+
+# Command-line entry point.
+
+def bril2c():
+    prog = json.load(sys.stdin)
+    try:
+        code = prog_to_c(prog)
+    except ValueError as exc:
+        sys.exit('bril2c: {}'.format(exc))
+    if sys.argv[1:] == ['run']:
+        sys.exit(run_c(code))
+    elif sys.argv[1:] == ['build']:
+        print(compile_c(code))
+    else:
+        print(code)
+
+
+if __name__ == '__main__':
+    bril2c()
@@ -0,0 +1,79 @@
+"""A thin client for `bril_server.py`.
+
+Run a Bril tool in the server as if it were the standalone command:
+
+    bril_client.py TOOL [ARGS...] < INPUT
+
+The tools are `parse` (like `bril2json`), `print` (like `bril2txt`),
+`lvn`, `tdce`, and `df`; the arguments are the same as for the
+standalone scripts. The tool's output and error messages come back on
+stdout and stderr, and the client exits with the tool's status. This
+module imports as little as possible so that it starts quickly.
+"""
+
+import json
+import os
+import socket
+import sys
+
+# Environment variables that affect the tools. The client sends its
+# values for these to the server, which sets them while the tool runs.
+ENV_VARS = ('BRIL_COMPACT',)
+
+
+def socket_path():
+    """Get the path for the server's socket, which can be set with the
+    `BRIL_SOCKET` environment variable.
+    """
+    return os.environ.get('BRIL_SOCKET') or os.path.join(
+        os.environ.get('TMPDIR', '/tmp'),
+        'bril-{}.sock'.format(os.getuid()),
+    )
+
+
+def request(tool, args, data, out, err):
+    """Send a request to the server and copy the tool's output and error
+    messages to the binary files `out` and `err`. Return the tool's exit
+    status.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(socket_path())
+    env = {k: os.environ[k] for k in ENV_VARS if k in os.environ}
+    header = json.dumps({
+        'tool': tool, 'args': args, 'env': env, 'cwd': os.getcwd(),
+    }) + '\n'
+    sock.sendall(header.encode('utf8') + data)
+    sock.shutdown(socket.SHUT_WR)
+
+    with sock.makefile('rb') as f:
+        reply = json.loads(f.readline().decode('utf8'))
+        remaining = reply['stdout']  # Bytes of output before the errors.
+        while True:
+            chunk = f.read1(1 << 16)
+            if not chunk:
+                break
+            if remaining:
+                part = chunk[:remaining]
+                out.write(part)
+                remaining -= len(part)
+                chunk = chunk[len(part):]
+            err.write(chunk)
+    sock.close()
+    return reply['status']
+
+
+def main():
+    if len(sys.argv) < 2:
+        sys.exit('usage: {} TOOL [ARGS...]'.format(sys.argv[0]))
+    data = sys.stdin.buffer.read()
+    try:
+        status = request(sys.argv[1], sys.argv[2:], data,
+                         sys.stdout.buffer, sys.stderr.buffer)
+    except (FileNotFoundError, ConnectionRefusedError):
+        sys.exit('no Bril server at {}; start one with '
+                 'bril_server.py'.format(socket_path()))
+    sys.exit(status)
+
+
+if __name__ == '__main__':
+    main()
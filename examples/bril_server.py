@@ -0,0 +1,165 @@
+"""A long-running server for the Bril tools.
+
+Starting Python, importing the tools, and building the text format
+parser take longer than running a tool on a small program. This server
+does that work once and then runs tools on behalf of `bril_client.py`
+over a Unix domain socket. Requests are handled concurrently: the server
+accepts connections with asyncio and runs the tools in a pool of worker
+processes.
+
+Each tool is the same entry point as the standalone command, run with
+stdin, stdout, and `sys.argv` redirected, so the output is identical.
+
+The protocol is simple. The client sends a JSON header line,
+`{"tool": ..., "args": [...], "env": {...}, "cwd": ...}`, followed by
+the input and then closes its side of the connection. The environment
+holds the client's values for the variables in `bril_client.ENV_VARS`,
+and the tool runs in the client's working directory, so file arguments
+mean the same thing as they do for the standalone command. The server
+replies with a JSON header line, `{"status": ..., "stdout": ...}`,
+giving the tool's exit status and the length in bytes of its standard
+output, followed by the output and then everything the tool wrote to
+standard error.
+"""
+
+import asyncio
+import io
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+import briltxt
+from bril_client import ENV_VARS, socket_path
+import df
+import lvn
+import tdce
+
+TOOLS = {
+    'parse': briltxt.bril2json,
+    'print': briltxt.bril2txt,
+    'lvn': lvn.main,
+    'tdce': tdce.localopt,
+    'df': df.main,
+}
+
+# Size of the pieces of output to send back at a time.
+CHUNK_SIZE = 1 << 16
+
+
+def set_env(env):
+    """Set the variables in `ENV_VARS` to the values in `env`, removing
+    the ones that are missing. Return the old values.
+    """
+    old = {k: os.environ[k] for k in ENV_VARS if k in os.environ}
+    for k in ENV_VARS:
+        if k in env:
+            os.environ[k] = env[k]
+        else:
+            os.environ.pop(k, None)
+    return old
+
+
+def run_tool(tool, args, data, env=None, cwd=None):
+    """Run a tool's command-line entry point on some input, with the
+    environment variables in `env`, in the directory `cwd`. Return the
+    exit status and the standard output and error as bytes.
+    """
+    old = sys.stdin, sys.stdout, sys.stderr, sys.argv
+    old_env = set_env(env or {})
+    old_cwd = os.getcwd()
+    out = io.StringIO()
+    err = io.StringIO()
+    sys.stdin = io.TextIOWrapper(io.BytesIO(data), encoding='utf8')
+    sys.stdout = out
+    sys.stderr = err
+    sys.argv = [tool] + list(args)
+    status = 0
+    try:
+        if cwd is not None:
+            os.chdir(cwd)
+        TOOLS[tool]()
+    except SystemExit as exc:
+        # Exit the same way the interpreter does.
+        if isinstance(exc.code, int):
+            status = exc.code
+        elif exc.code is not None:
+            print(exc.code, file=err)
+            status = 1
+    except Exception:
+        traceback.print_exc(file=err)
+        status = 1
+    finally:
+        sys.stdin, sys.stdout, sys.stderr, sys.argv = old
+        set_env(old_env)
+        os.chdir(old_cwd)
+    return status, out.getvalue().encode('utf8'), \
+        err.getvalue().encode('utf8')
+
+
+def warm():
+    """Do the slow one-time setup in a worker process.
+    """
+    briltxt.get_parser()
+
+
+async def handle(pool, reader, writer):
+    try:
+        request = json.loads((await reader.readline()).decode('utf8'))
+        data = await reader.read()
+        tool = request['tool']
+        if tool not in TOOLS:
+            status, out = 1, b''
+            err = 'unknown tool {}\n'.format(tool).encode('utf8')
+        else:
+            loop = asyncio.get_event_loop()
+            status, out, err = await loop.run_in_executor(
+                pool, run_tool, tool, request.get('args', []), data,
+                request.get('env', {}), request.get('cwd'),
+            )
+
+        reply = json.dumps({'status': status, 'stdout': len(out)})
+        writer.write(reply.encode('utf8') + b'\n')
+        result = out + err
+        for i in range(0, len(result), CHUNK_SIZE):
+            writer.write(result[i:i + CHUNK_SIZE])
+            await writer.drain()
+    finally:
+        writer.close()
+
+
+def serve(path, workers=None):
+    """Listen on a Unix domain socket until interrupted.
+    """
+    if os.path.exists(path):
+        os.remove(path)  # A leftover from an earlier server.
+
+    # Start workers with a fork server so they do not inherit the
+    # sockets of connections that are open when they start.
+    pool = ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('forkserver'),
+        initializer=warm,
+    )
+
+    loop = asyncio.get_event_loop()
+    loop.add_signal_handler(signal.SIGTERM, loop.stop)
+    server = loop.run_until_complete(asyncio.start_unix_server(
+        lambda r, w: handle(pool, r, w), path=path,
+    ))
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        loop.run_until_complete(server.wait_closed())
+        pool.shutdown()
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    serve(socket_path(), int(sys.argv[1]) if len(sys.argv) > 1 else None)
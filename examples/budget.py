@@ -0,0 +1,101 @@
+"""Work budgets for iterative algorithms.
+
+Fixed-point loops like dead code elimination, data flow, and dominators
+normally run until nothing changes. A budget bounds how much work they
+may do on each function: a number of iterations (rounds of the main
+loop), a number of transfer function applications, or a time limit.
+
+A `Budget` holds the limits and hands out a `Meter` for every function.
+Algorithms that accept a meter charge their work to it and stop safely
+when it runs out: transformations keep the (correct) program they have
+so far, and analyses give up on precision and return a conservative
+answer. The budget records the functions whose meters ran out.
+"""
+
+import sys
+import time
+
+# Command-line options for each limit.
+OPTIONS = {
+    '--max-iters': ('iterations', int),
+    '--max-transfers': ('transfers', int),
+    '--deadline': ('seconds', float),
+}
+
+
+class Budget(object):
+    """Limits on the work done for each function. None means no limit.
+    """
+    def __init__(self, iterations=None, transfers=None, seconds=None):
+        self.iterations = iterations
+        self.transfers = transfers
+        self.seconds = seconds
+        self.exhausted = []  # Names of functions that ran out.
+
+    def meter(self, name):
+        """Start measuring the work done on a function.
+        """
+        return Meter(self, name)
+
+
+class Meter(object):
+    """The work done so far on one function.
+    """
+    def __init__(self, budget, name):
+        self.budget = budget
+        self.name = name
+        self.iterations = 0
+        self.transfers = 0
+        self.deadline = None
+        if budget.seconds is not None:
+            self.deadline = time.monotonic() + budget.seconds
+        self.exhausted = False
+
+    def spend(self, iterations=0, transfers=0):
+        """Charge some work. Return True if there is budget left to keep
+        going, or False if the algorithm should stop now.
+        """
+        self.iterations += iterations
+        self.transfers += transfers
+        if not self.exhausted:
+            b = self.budget
+            if (b.iterations is not None and
+                    self.iterations > b.iterations) or \
+                    (b.transfers is not None and
+                     self.transfers > b.transfers) or \
+                    (self.deadline is not None and
+                     time.monotonic() > self.deadline):
+                self.stop()
+        return not self.exhausted
+
+    def stop(self):
+        """Give up on the function as if the budget had run out (for
+        example, because the answer would be too big to hold).
+        """
+        if not self.exhausted:
+            self.exhausted = True
+            self.budget.exhausted.append(self.name)
+
+
+def budget_args(args):
+    """Remove the budget options (`--max-iters N`, `--max-transfers N`,
+    and `--deadline SECONDS`) from a list of command-line arguments.
+    Return a Budget, or None if there were no options, and the remaining
+    arguments.
+    """
+    args = list(args)
+    limits = {}
+    for opt, (key, conv) in OPTIONS.items():
+        if opt in args:
+            idx = args.index(opt)
+            limits[key] = conv(args[idx + 1])
+            del args[idx:idx + 2]
+    return (Budget(**limits) if limits else None), args
+
+
+def report(budget):
+    """Print the functions that ran out of budget to stderr.
+    """
+    if budget is not None:
+        for name in budget.exhausted:
+            print('budget exhausted: {}'.format(name), file=sys.stderr)
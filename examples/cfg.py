@@ -13,6 +13,7 @@ def block_map(blocks):
     labels removed.
     """
     by_name = OrderedDict()
+    anon = 1  # No block named b1, b2, ... below this number is free.
 
     for block in blocks:
         # Generate a name for the block.
@@ -23,7 +24,8 @@ def block_map(blocks):
             block = block[1:]
         else:
             # Make up a new name for this anonymous block.
-            name = fresh('b', by_name)
+            name = fresh('b', by_name, anon)
+            anon = int(name[1:])
 
         # Add the block to the mapping.
         by_name[name] = block
@@ -47,18 +49,40 @@ def successors(instr):
         raise ValueError('{} is not a terminator'.format(instr['op']))
 
 
+def retarget(instr, old, new):
+    """Change a terminator instruction so that it jumps to the label
+    `new` wherever it used to jump to `old`.
+    """
+    start = 1 if instr['op'] == 'br' else 0
+    instr['args'] = instr['args'][:start] + [
+        new if a == old else a for a in instr['args'][start:]
+    ]
+
+
+def insert_before(blocks, before, name, block):
+    """Add a new block to a block map, placing it just before the block
+    named `before`.
+    """
+    items = list(blocks.items())
+    idx = list(blocks.keys()).index(before)
+    items.insert(idx, (name, block))
+    blocks.clear()
+    blocks.update(items)
+
+
 def add_terminators(blocks):
     """Given an ordered block map, modify the blocks to add terminators
     to all blocks (avoiding "fall-through" control flow transfers).
     """
+    names = list(blocks.keys())
     for i, block in enumerate(blocks.values()):
-        if block[-1]['op'] not in TERMINATORS:
+        if not block or block[-1]['op'] not in TERMINATORS:
             if i == len(blocks) - 1:
                 # In the last block, return.
                 block.append({'op': 'ret', 'args': []})
             else:
                 # Otherwise, jump to the next block.
-                dest = list(blocks.keys())[i + 1]
+                dest = names[i + 1]
                 block.append({'op': 'jmp', 'args': [dest]})
 
 
@@ -74,3 +98,70 @@ def edges(blocks):
             succs[name].append(succ)
             preds[succ].append(name)
     return preds, succs
+
+
+def sccs(nodes, succs):
+    """Find the strongly connected components of a graph using Tarjan's
+    algorithm. `nodes` is a sequence of nodes and `succs` maps nodes to
+    lists of successors; edges that leave `nodes` are ignored. Produce a
+    list of components (lists of nodes) in reverse topological order.
+
+    The search uses an explicit stack, so it works on very deep graphs.
+    """
+    members = set(nodes)
+    index = {}
+    low = {}
+    stack = []
+    on_stack = set()
+    out = []
+
+    for root in nodes:
+        if root in index:
+            continue
+        index[root] = low[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(succs[root]))]
+
+        while work:
+            node, it = work[-1]
+            for succ in it:
+                if succ not in members:
+                    continue
+                if succ not in index:
+                    # Descend into the successor.
+                    index[succ] = low[succ] = len(index)
+                    stack.append(succ)
+                    on_stack.add(succ)
+                    work.append((succ, iter(succs[succ])))
+                    break
+                elif succ in on_stack:
+                    low[node] = min(low[node], index[succ])
+            else:
+                # Done with this node's successors.
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    out.append(component)
+
+    return out
+
+
+def reassemble(blocks):
+    """Flatten a block map back into a list of instructions, with a
+    label at the start of every block.
+    """
+    instrs = []
+    for name, block in blocks.items():
+        instrs.append({'label': name})
+        instrs += block
+    return instrs
@@ -1,47 +1,253 @@
 """Form a basic-block-based control-flow graph for a Bril function and
 emit a GraphViz file.
+
+Graphs of big functions are too large to read (or for GraphViz to lay
+out), so there are options to draw only part of a graph and to simplify
+it:
+
+- `--function NAME`: Only draw one function.
+- `--around BLOCK`: Only draw the blocks near a given block: at most
+  `--hops N` edges away (2 by default).
+- `--loops`: Only draw the blocks that are on a cycle.
+- `--collapse`: Draw straight-line chains of blocks as single vertices.
+- `--cluster`: Group the blocks in each loop together, nested by loop.
+- `-v`: Include the instructions in the vertices.
 """
 
-from form_blocks import form_blocks
-import json
+from collections import OrderedDict
+import re
 import sys
-from cfg import block_map, successors, add_terminators
 
+from cfg import block_map, successors, add_terminators, edges, sccs
+from form_blocks import form_blocks
+from funcindex import load_program
+from loops import loop_nest
+
+# Identifiers that GraphViz accepts without quotes.
+PLAIN_ID = re.compile(r'[A-Za-z_][A-Za-z0-9_]*$')
 
-def cfg_dot(bril, verbose):
-    """Generate a GraphViz "dot" file showing the control flow graph for
-    a Bril program.
 
-    In `verbose` mode, include the instructions in the vertices.
+def dot_id(name):
+    """Quote a name for GraphViz, if necessary.
     """
-    for func in bril['functions']:
-        print('digraph {} {{'.format(func['name']))
+    if PLAIN_ID.match(name):
+        return name
+    return '"{}"'.format(name.replace('\\', '\\\\').replace('"', '\\"'))
+
+
+def around(preds, succs, start, hops):
+    """Find the blocks at most `hops` edges away from `start`, following
+    edges in either direction.
+    """
+    seen = {start}
+    frontier = [start]
+    for _ in range(hops):
+        new = []
+        for node in frontier:
+            for n in preds[node] + succs[node]:
+                if n not in seen:
+                    seen.add(n)
+                    new.append(n)
+        frontier = new
+    return seen
+
+
+def cyclic(names, succs):
+    """Find the blocks that are on some cycle.
+    """
+    out = set()
+    for component in sccs(names, succs):
+        if len(component) > 1 or component[0] in succs[component[0]]:
+            out.update(component)
+    return out
+
+
+def innermost(loops, out=None):
+    """Map every block in a loop nest to the header of the innermost loop
+    that contains it.
+    """
+    if out is None:
+        out = {}
+    for loop in loops:
+        for name in loop.body:
+            out[name] = loop.header
+        innermost(loop.children, out)
+    return out
+
+
+def chains(names, preds, succs, group):
+    """Group a sequence of blocks into straight-line chains, where every
+    block is the only successor of the block before it, which is its
+    only predecessor. Chains stay within a single group (a dict mapping
+    block names to any value). Produce an ordered dict mapping the first
+    block in each chain to a list of the blocks in the chain.
+    """
+    members = set(names)
+
+    def joined(a, b):
+        return a != b and succs[a] == [b] and preds[b] == [a] and \
+            a in members and group.get(a) == group.get(b)
+
+    out = OrderedDict()
+    covered = set()
+
+    def walk(start):
+        chain = [start]
+        covered.add(start)
+        while len(succs[chain[-1]]) == 1:
+            succ = succs[chain[-1]][0]
+            if succ in covered or succ not in members or \
+                    not joined(chain[-1], succ):
+                break
+            chain.append(succ)
+            covered.add(succ)
+        out[start] = chain
+
+    for name in names:
+        if not (len(preds[name]) == 1 and joined(preds[name][0], name)):
+            walk(name)
+
+    # Whatever is left is on a cycle made of chained blocks.
+    for name in names:
+        if name not in covered:
+            walk(name)
 
-        blocks = block_map(form_blocks(func['instrs']))
+    return out
 
-        # Insert terminators into blocks that don't have them.
-        add_terminators(blocks)
 
-        # Add the vertices.
-        for name, block in blocks.items():
-            if verbose:
-                import briltxt
-                print(r'  {} [shape=box, xlabel="{}", label="{}\l"];'.format(
-                    name,
-                    name,
-                    r'\l'.join(briltxt.instr_to_string(i) for i in block),
+def vertex(blocks, chain, verbose):
+    """Produce the GraphViz vertex for a chain of blocks.
+    """
+    name = chain[0]
+    if verbose:
+        import briltxt
+        lines = []
+        for n in chain:
+            if len(chain) > 1:
+                lines.append('{}:'.format(n))
+            lines += [briltxt.instr_to_string(i) for i in blocks[n]]
+        return r'{} [shape=box, xlabel="{}", label="{}\l"];'.format(
+            dot_id(name),
+            name,
+            r'\l'.join(lines),
+        )
+    elif len(chain) > 1:
+        return '{} [label="{} ... {} ({} blocks)"];'.format(
+            dot_id(name), name, chain[-1], len(chain),
+        )
+    else:
+        return '{};'.format(dot_id(name))
+
+
+def cluster(loop, groups, lines, depth):
+    """Add the lines for a loop's cluster (including the clusters nested
+    inside it) to `lines`, if any of its vertices are being drawn.
+    """
+    indent = '  ' * depth
+    inner = []
+    for child in loop.children:
+        cluster(child, groups, inner, depth + 1)
+    vertices = groups.get(loop.header, [])
+    if inner or vertices:
+        lines.append('{}subgraph {} {{'.format(
+            indent, dot_id('cluster_' + loop.header),
+        ))
+        lines.append('{}  label={};'.format(indent, dot_id(loop.header)))
+        lines += inner
+        lines += ['{}  {}'.format(indent, v) for v in vertices]
+        lines.append('{}}}'.format(indent))
+
+
+def func_dot(func, verbose, around_block=None, hops=2, loops_only=False,
+             collapse=False, clusters=False):
+    """Generate the lines of a GraphViz "dot" file for a Bril function,
+    or None if it does not contain `around_block`.
+    """
+    lines = ['digraph {} {{'.format(dot_id(func['name']))]
+
+    blocks = block_map(form_blocks(func['instrs']))
+    if around_block is not None and around_block not in blocks:
+        return None
+
+    # Insert terminators into blocks that don't have them.
+    add_terminators(blocks)
+
+    names = list(blocks.keys())
+    preds, succs = edges(blocks)
+
+    # Choose the blocks to draw.
+    selected = set(names)
+    if around_block is not None:
+        selected &= around(preds, succs, around_block, hops)
+    if loops_only:
+        selected &= cyclic(names, succs)
+    names = [n for n in names if n in selected]
+
+    group = {}
+    loops = []
+    if clusters:
+        loops = loop_nest(list(blocks.keys()), succs, preds)
+        group = innermost(loops)
+
+    if collapse:
+        chain_map = chains(names, preds, succs, group)
+    else:
+        chain_map = OrderedDict((n, [n]) for n in names)
+
+    # Add the vertices.
+    groups = {}
+    for name, chain in chain_map.items():
+        groups.setdefault(group.get(name), []).append(
+            vertex(blocks, chain, verbose),
+        )
+    lines += ['  {}'.format(v) for v in groups.get(None, [])]
+    for loop in loops:
+        cluster(loop, groups, lines, 1)
+
+    # Add the control-flow edges.
+    head = {n: first for first, chain in chain_map.items() for n in chain}
+    for first, chain in chain_map.items():
+        for label in successors(blocks[chain[-1]][-1]):
+            if label in head:
+                lines.append('  {} -> {};'.format(
+                    dot_id(first), dot_id(head[label]),
                 ))
-            else:
-                print('  {};'.format(name))
 
-        # Add the control-flow edges.
-        for i, (name, block) in enumerate(blocks.items()):
-            succ = successors(block[-1])
-            for label in succ:
-                print('  {} -> {};'.format(name, label))
+    lines.append('}')
+    return lines
+
+
+def cfg_dot(bril, verbose, out=None, **options):
+    """Generate a GraphViz "dot" file showing the control flow graph for
+    a Bril program.
+
+    In `verbose` mode, include the instructions in the vertices. The
+    other options are passed to `func_dot`. Each function is written to
+    `out` (standard output by default) all at once.
+    """
+    out = out or sys.stdout
+    for func in bril['functions']:
+        lines = func_dot(func, verbose, **options)
+        if lines is not None:
+            out.write('\n'.join(lines))
+            out.write('\n')
+
 
-        print('}')
+def parse_options(args):
+    """Get the `func_dot` options from the command-line arguments.
+    """
+    options = {
+        'loops_only': '--loops' in args,
+        'collapse': '--collapse' in args,
+        'clusters': '--cluster' in args,
+    }
+    if '--around' in args:
+        options['around_block'] = args[args.index('--around') + 1]
+    if '--hops' in args:
+        options['hops'] = int(args[args.index('--hops') + 1])
+    return options
 
 
 if __name__ == '__main__':
-    cfg_dot(json.load(sys.stdin), '-v' in sys.argv[1:])
+    bril, args = load_program(sys.argv[1:])
+    cfg_dot(bril, '-v' in args, **parse_options(args))
@@ -0,0 +1,142 @@
+"""Variable coalescing for Bril.
+
+Build an interference graph from live variable analysis and give
+variables whose live ranges never overlap the same name, so functions
+use fewer distinct variables. Copies between variables that end up with
+the same name are deleted.
+"""
+
+import sys
+
+import briltxt
+import cfg
+import df
+from form_blocks import form_blocks, TERMINATORS
+
+
+def interference(blocks):
+    """Build an interference graph for a block map: a dict mapping every
+    variable to the set of variables that are live at the same time.
+    Copies do not make their source and destination interfere.
+    """
+    solution = df.Solution(blocks, df.ANALYSES['live'])
+    live_in, _ = solution.facts()
+    live = df.InstrFacts(solution)
+    graph = {}
+
+    def add_edge(a, b):
+        graph.setdefault(a, set()).add(b)
+        graph.setdefault(b, set()).add(a)
+
+    for name, block in blocks.items():
+        for idx, instr in enumerate(block):
+            if 'dest' in instr:
+                dest = instr['dest']
+                graph.setdefault(dest, set())
+                copied = instr['args'][0] if instr['op'] == 'id' else None
+                for var in live.after(name, idx):
+                    if var != dest and var != copied:
+                        add_edge(dest, var)
+
+    # Variables that might be read before they are written all
+    # interfere with each other.
+    undefined = live_in[list(blocks.keys())[0]]
+    for a in undefined:
+        for b in undefined:
+            if a != b:
+                add_edge(a, b)
+
+    return graph
+
+
+def rename_args(instr, names):
+    """Rename the variable arguments to an instruction.
+    """
+    if 'args' in instr:
+        if instr['op'] == 'br':
+            instr['args'][0] = names.get(instr['args'][0],
+                                         instr['args'][0])
+        elif instr['op'] not in TERMINATORS:
+            instr['args'] = [names.get(a, a) for a in instr['args']]
+
+
+def coalesce_func(func, renumber=False):
+    """Merge non-interfering variables of the same type in a function.
+    With `renumber`, give the merged variables compact names `v0`, `v1`,
+    and so on; otherwise, each one keeps the name of its first member.
+    """
+    blocks = cfg.block_map(form_blocks(func['instrs']))
+    if not blocks:
+        return
+    cfg.add_terminators(blocks)
+    graph = interference(blocks)
+
+    # Find the type of every variable and the variables each one is
+    # copied to or from, in order of appearance.
+    types = {}
+    partners = {}
+    for instr in func['instrs']:
+        if 'dest' in instr:
+            types.setdefault(instr['dest'], instr['type'])
+            if instr['op'] == 'id':
+                a, b = instr['dest'], instr['args'][0]
+                partners.setdefault(a, []).append(b)
+                partners.setdefault(b, []).append(a)
+
+    # Greedily assign every variable to a class of non-interfering
+    # variables, preferring a class that holds a copy partner.
+    classes = []  # (type, members) pairs.
+    var2class = {}
+    for var, typ in types.items():
+        neighbors = graph.get(var, set())
+        fits = [i for i, (t, members) in enumerate(classes)
+                if t == typ and not members & neighbors]
+        choice = None
+        for partner in partners.get(var, []):
+            if var2class.get(partner) in fits:
+                choice = var2class[partner]
+                break
+        if choice is None:
+            if fits:
+                choice = fits[0]
+            else:
+                choice = len(classes)
+                classes.append((typ, set()))
+        classes[choice][1].add(var)
+        var2class[var] = choice
+
+    # Pick a name for each class.
+    if renumber:
+        # Avoid variables that are read but never written.
+        taken = set(graph) - set(var2class)
+        class_names = []
+        i = 0
+        while len(class_names) < len(classes):
+            name = 'v{}'.format(i)
+            if name not in taken:
+                class_names.append(name)
+            i += 1
+    else:
+        class_names = [None] * len(classes)
+        for var, idx in var2class.items():
+            if class_names[idx] is None:
+                class_names[idx] = var
+    names = {var: class_names[idx] for var, idx in var2class.items()}
+
+    # Rename everything and drop the copies that became trivial.
+    instrs = []
+    for instr in func['instrs']:
+        if 'dest' in instr:
+            instr['dest'] = names[instr['dest']]
+        rename_args(instr, names)
+        if instr.get('op') == 'id' and instr['args'] == [instr['dest']]:
+            continue
+        instrs.append(instr)
+    func['instrs'] = instrs
+
+
+if __name__ == '__main__':
+    bril = briltxt.load(sys.stdin)
+    for func in bril['functions']:
+        coalesce_func(func, '-r' in sys.argv)
+    briltxt.dump(bril, sys.stdout)
@@ -0,0 +1,342 @@
+"""Compact control flow graphs for very large functions.
+
+The block maps and edge dicts in `cfg` hold a Python list of label
+strings for every block, and the traversals in `dom` recurse. For
+functions with hundreds of thousands of blocks, that takes a lot of
+memory, and the recursion overflows the stack.
+
+A `Graph` instead numbers the blocks 0 to n-1 in program order (so the
+entry is 0) and stores the edges in compressed sparse row form: two
+flat integer arrays for the successors and two for the predecessors.
+The traversals here (depth-first numbering, strongly connected
+components, and immediate dominators) use explicit stacks and integer
+arrays throughout.
+
+For code that works with names, `Graph.succ_map` and `Graph.pred_map`
+are read-only views that look like the edge dicts from `cfg.edges`, so
+they can be passed to `dom.get_dom`. `df.df_worklist` takes a graph
+through its `graph` argument.
+"""
+
+from array import array
+from collections.abc import Mapping
+import sys
+
+from cfg import block_map, successors, add_terminators
+from form_blocks import form_blocks
+from funcindex import load_program
+
+# The number for a node that a traversal did not reach.
+UNVISITED = -1
+
+
+def filled(value, count):
+    """Make an integer array of `count` copies of `value`.
+    """
+    return array('i', [value]) * count
+
+
+class Graph(object):
+    """A control flow graph with integer node IDs. The successors of node
+    `i` are `succ_list[succ_start[i]:succ_start[i + 1]]`, and likewise
+    for the predecessors. `names` maps IDs to block names and `ids` maps
+    them back.
+    """
+    def __init__(self, names, succ_start, succ_list):
+        self.names = names
+        self.ids = {name: i for i, name in enumerate(names)}
+        self.succ_start = succ_start
+        self.succ_list = succ_list
+        self.pred_start, self.pred_list = transpose(succ_start, succ_list)
+
+    @classmethod
+    def from_blocks(cls, blocks):
+        """Build the graph for a block map whose blocks all end with
+        terminators.
+        """
+        names = list(blocks.keys())
+        ids = {name: i for i, name in enumerate(names)}
+        start = array('i', [0])
+        targets = array('i')
+        for block in blocks.values():
+            targets.extend(ids[s] for s in successors(block[-1]))
+            start.append(len(targets))
+        return cls(names, start, targets)
+
+    def __len__(self):
+        return len(self.names)
+
+    def succs(self, node):
+        return self.succ_list[self.succ_start[node]:self.succ_start[node + 1]]
+
+    def preds(self, node):
+        return self.pred_list[self.pred_start[node]:self.pred_start[node + 1]]
+
+    def succ_map(self):
+        """A view of the successors that maps block names to lists of
+        block names, like the second dict from `cfg.edges`.
+        """
+        return Neighbors(self, self.succ_start, self.succ_list)
+
+    def pred_map(self):
+        """A view of the predecessors that maps block names to lists of
+        block names, like the first dict from `cfg.edges`.
+        """
+        return Neighbors(self, self.pred_start, self.pred_list)
+
+
+class Neighbors(Mapping):
+    """Edges in a graph, looked up by name. Lists of names are built on
+    demand, so the view takes no memory of its own.
+    """
+    def __init__(self, graph, start, targets):
+        self.graph = graph
+        self.start = start
+        self.targets = targets
+
+    def __getitem__(self, name):
+        i = self.graph.ids[name]
+        names = self.graph.names
+        return [names[j] for j in
+                self.targets[self.start[i]:self.start[i + 1]]]
+
+    def __iter__(self):
+        return iter(self.graph.names)
+
+    def __len__(self):
+        return len(self.graph.names)
+
+
+def transpose(start, targets):
+    """Reverse the edges of a graph in compressed sparse row form.
+    Produce the new start and target arrays. The sources for each node
+    come out in increasing order.
+    """
+    n = len(start) - 1
+    out_start = filled(0, n + 1)
+    for t in targets:
+        out_start[t + 1] += 1
+    for i in range(n):
+        out_start[i + 1] += out_start[i]
+
+    fill = array('i', out_start)
+    out = filled(0, len(targets))
+    for node in range(n):
+        for k in range(start[node], start[node + 1]):
+            t = targets[k]
+            out[fill[t]] = node
+            fill[t] += 1
+    return out_start, out
+
+
+def dfs(graph, root=0):
+    """Search the graph depth-first from `root`, visiting successors in
+    order. Produce two arrays giving the preorder and postorder number
+    of every node (UNVISITED for nodes that are unreachable).
+    """
+    n = len(graph)
+    start, targets = graph.succ_start, graph.succ_list
+    pre = filled(UNVISITED, n)
+    post = filled(UNVISITED, n)
+
+    pre[root] = 0
+    num_pre = 1
+    num_post = 0
+    nodes = [root]            # The current path.
+    positions = [start[root]]  # The next edge to follow from each node.
+    while nodes:
+        node = nodes[-1]
+        k = positions[-1]
+        end = start[node + 1]
+        while k < end and pre[targets[k]] != UNVISITED:
+            k += 1
+        if k < end:
+            # Descend into the successor.
+            positions[-1] = k + 1
+            succ = targets[k]
+            pre[succ] = num_pre
+            num_pre += 1
+            nodes.append(succ)
+            positions.append(start[succ])
+        else:
+            # Done with this node's successors.
+            nodes.pop()
+            positions.pop()
+            post[node] = num_post
+            num_post += 1
+    return pre, post
+
+
+def ordering(numbers):
+    """Invert a numbering (such as one from `dfs`): produce an array of
+    the numbered nodes, in order of their numbers.
+    """
+    out = filled(0, sum(1 for x in numbers if x != UNVISITED))
+    for node, x in enumerate(numbers):
+        if x != UNVISITED:
+            out[x] = node
+    return out
+
+
+def postorder(graph, root=0):
+    """The nodes reachable from `root`, in postorder.
+    """
+    return ordering(dfs(graph, root)[1])
+
+
+def reverse_postorder(graph, root=0):
+    """The nodes reachable from `root`, in reverse postorder.
+    """
+    out = postorder(graph, root)
+    out.reverse()
+    return out
+
+
+def scc_ids(graph):
+    """Find the strongly connected components of the graph using Tarjan's
+    algorithm. Produce an array giving the component number of every
+    node and the number of components. Components are numbered in
+    reverse topological order: no edge leads to a component with a
+    higher number.
+    """
+    n = len(graph)
+    start, targets = graph.succ_start, graph.succ_list
+    index = filled(UNVISITED, n)
+    low = filled(0, n)
+    comp = filled(UNVISITED, n)
+    stack = array('i')
+    count = 0
+    num = 0
+
+    for root in range(n):
+        if index[root] != UNVISITED:
+            continue
+        index[root] = low[root] = num
+        num += 1
+        stack.append(root)
+        nodes = [root]
+        positions = [start[root]]
+
+        while nodes:
+            node = nodes[-1]
+            k = positions[-1]
+            end = start[node + 1]
+            while k < end:
+                succ = targets[k]
+                k += 1
+                if index[succ] == UNVISITED:
+                    break
+                if comp[succ] == UNVISITED:  # Still on the stack.
+                    low[node] = min(low[node], index[succ])
+            else:
+                # Done with this node's successors.
+                nodes.pop()
+                positions.pop()
+                if nodes:
+                    parent = nodes[-1]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == index[node]:
+                    while True:
+                        member = stack.pop()
+                        comp[member] = count
+                        if member == node:
+                            break
+                    count += 1
+                continue
+
+            # Descend into the successor.
+            positions[-1] = k
+            index[succ] = low[succ] = num
+            num += 1
+            stack.append(succ)
+            nodes.append(succ)
+            positions.append(start[succ])
+
+    return comp, count
+
+
+def sccs(graph):
+    """Find the strongly connected components of the graph. Produce a
+    list of components (lists of node IDs) in reverse topological order.
+    """
+    comp, count = scc_ids(graph)
+    out = [[] for _ in range(count)]
+    for node, c in enumerate(comp):
+        out[c].append(node)
+    return out
+
+
+def idoms(graph, root=0, meter=None):
+    """Compute the immediate dominator of every node reachable from
+    `root`, using the iterative algorithm of Cooper, Harvey, and
+    Kennedy. Produce an array mapping each node to its immediate
+    dominator: `root` maps to itself and unreachable nodes to
+    UNVISITED. If the `meter` runs out of budget, fall back to the
+    conservative answer that each node is dominated only by itself and
+    the root.
+    """
+    _, post = dfs(graph, root)
+    order = ordering(post)
+    order.reverse()
+    idom = filled(UNVISITED, len(graph))
+    idom[root] = root
+
+    def intersect(a, b):
+        while a != b:
+            while post[a] < post[b]:
+                a = idom[a]
+            while post[b] < post[a]:
+                b = idom[b]
+        return a
+
+    changed = True
+    while changed:
+        changed = False
+        if meter is not None and not meter.spend(1, len(order)):
+            for node in order:
+                idom[node] = root
+            break
+
+        for node in order[1:]:
+            new = UNVISITED
+            for p in graph.preds(node):
+                if idom[p] == UNVISITED:
+                    continue  # Unreachable or not yet processed.
+                new = p if new == UNVISITED else intersect(p, new)
+            if idom[node] != new:
+                idom[node] = new
+                changed = True
+
+    return idom
+
+
+def print_graphs(bril):
+    """Print the numbering, components, and immediate dominators of
+    every block in a program.
+    """
+    for func in bril['functions']:
+        blocks = block_map(form_blocks(func['instrs']))
+        add_terminators(blocks)
+        graph = Graph.from_blocks(blocks)
+        print('{}:'.format(func['name']))
+        if not len(graph):
+            continue
+        pre, post = dfs(graph)
+        comp, _ = scc_ids(graph)
+        idom = idoms(graph)
+        reached = len(ordering(post))
+        for node, name in enumerate(graph.names):
+            if pre[node] == UNVISITED:
+                print('  {}: unreachable'.format(name))
+                continue
+            print('  {}: pre {} rpo {} scc {} idom {}'.format(
+                name,
+                pre[node],
+                reached - 1 - post[node],
+                comp[node],
+                graph.names[idom[node]] if node else '-',
+            ))
+
+
+if __name__ == '__main__':
+    print_graphs(load_program(sys.argv[1:])[0])
@@ -1,9 +1,12 @@
 import sys
-import json
-from collections import namedtuple
+from collections import namedtuple, OrderedDict, deque
 
+from briltxt import instr_to_string
+from budget import Budget, budget_args, report
 from form_blocks import form_blocks
+from funcindex import load_program
 import cfg
+import csr
 from util import var_args
 
 # A single dataflow analysis consists of these part:
@@ -11,7 +14,11 @@ from util import var_args
 # - init: An initial value (bottom or top of the latice).
 # - merge: Take a list of values and produce a single value.
 # - transfer: The transfer function.
-Analysis = namedtuple('Analysis', ['forward', 'init', 'merge', 'transfer'])
+# - widen: Optionally, take the blocks and produce a conservative value
+#   that is safe to use everywhere when the analysis runs out of budget.
+Analysis = namedtuple('Analysis',
+                      ['forward', 'init', 'merge', 'transfer', 'widen'])
+Analysis.__new__.__defaults__ = (None,)
 
 
 def union(sets):
@@ -21,44 +28,204 @@ def union(sets):
     return out
 
 
-def df_worklist(blocks, analysis):
-    """The worklist algorithm for iterating a data flow analysis to a
-    fixed point.
+class Solution(object):
+    """The result of a data flow analysis on a block map, which can be
+    brought up to date after some of the blocks change.
+
+    `in_` and `out` map block names to the values on the way into and
+    out of each block in the direction of the analysis (so for a
+    backward analysis, `in_` holds the values at the ends of blocks).
+
+    If a `csr.Graph` for the blocks is given, the edges are looked up in
+    it instead of being copied into dicts of lists.
     """
-    preds, succs = cfg.edges(blocks)
+    def __init__(self, blocks, analysis, meter=None, graph=None):
+        self.blocks = blocks
+        self.analysis = analysis
+        self.graph = graph
+        self.in_ = {}
+        self.out = {}
+        self.in_edges, self.out_edges = self._edges()
+        self._solve(list(blocks.keys()), meter)
 
-    # Switch between directions.
-    if analysis.forward:
-        first_block = list(blocks.keys())[0]  # Entry.
-        in_edges = preds
-        out_edges = succs
-    else:
-        first_block = list(blocks.keys())[-1]  # Exit.
-        in_edges = succs
-        out_edges = preds
+    def _edges(self):
+        if self.graph is not None:
+            preds, succs = self.graph.pred_map(), self.graph.succ_map()
+        else:
+            preds, succs = cfg.edges(self.blocks)
+        if self.analysis.forward:
+            return preds, succs
+        else:
+            return succs, preds
 
-    # Initialize.
-    in_ = {first_block: analysis.init}
-    out = {node: analysis.init for node in blocks}
+    def _solve(self, nodes, meter):
+        """The worklist algorithm for iterating a data flow analysis to
+        a fixed point, starting over at the given blocks and leaving
+        the values for all other blocks alone. If the `meter` runs out
+        of budget, stop and use the analysis's conservative value for
+        every block.
+        """
+        analysis = self.analysis
+        in_, out = self.in_, self.out
+        members = set(nodes)
 
-    # Iterate.
-    worklist = list(blocks.keys())
-    while worklist:
-        node = worklist.pop(0)
+        # Initialize.
+        for node in nodes:
+            out[node] = analysis.init
 
-        inval = analysis.merge(out[n] for n in in_edges[node])
-        in_[node] = inval
+        # Iterate.
+        worklist = deque(nodes)
+        while worklist:
+            if meter is not None and not meter.spend(1, 1):
+                if analysis.widen is None:
+                    raise ValueError('analysis has no conservative value')
+                top = analysis.widen(self.blocks)
+                for node in self.blocks:
+                    in_[node] = out[node] = top
+                break
 
-        outval = analysis.transfer(blocks[node], inval)
+            node = worklist.popleft()
 
-        if outval != out[node]:
-            out[node] = outval
-            worklist += out_edges[node]
+            inval = analysis.merge(out[n] for n in self.in_edges[node])
+            in_[node] = inval
 
-    if analysis.forward:
-        return in_, out
-    else:
-        return out, in_
+            outval = analysis.transfer(self.blocks[node], inval)
+
+            if outval != out[node]:
+                out[node] = outval
+                worklist += [n for n in self.out_edges[node] if n in members]
+
+    def update(self, changed, meter=None):
+        """Re-solve the analysis after the blocks named in `changed` were
+        modified, added, or removed (including changes to their
+        terminators). The result is the same as solving from scratch.
+
+        Only blocks downstream of the changed blocks can have new
+        values. Their strongly connected components are visited in
+        topological order, so every component's inputs are final when
+        it is solved, and a component is skipped unless a changed
+        block or a new input value reaches it. A block that is not on
+        a cycle is recomputed once from its inputs. Old values on a
+        cycle could keep themselves alive after the edit, so cycles
+        are solved again from the initial value. An edit inside a loop
+        therefore still costs a full solve of the outermost loop around
+        it, but nothing beyond the loop is touched unless its values
+        change.
+        """
+        old_out_edges = self.out_edges
+        if self.graph is not None:
+            self.graph = csr.Graph.from_blocks(self.blocks)
+        self.in_edges, self.out_edges = self._edges()
+
+        for name in list(self.out):
+            if name not in self.blocks:
+                del self.in_[name]
+                del self.out[name]
+
+        # Blocks that gained or lost an edge from a changed block need
+        # to be recomputed too.
+        dirty = set()
+        for name in changed:
+            if name in self.blocks:
+                dirty.add(name)
+                dirty.update(self.out_edges[name])
+            dirty.update(n for n in old_out_edges.get(name, [])
+                         if n in self.blocks)
+
+        # Find everything downstream.
+        affected = set()
+        stack = list(dirty)
+        while stack:
+            node = stack.pop()
+            if node not in affected:
+                affected.add(node)
+                stack += self.out_edges[node]
+
+        nodes = [n for n in self.blocks if n in affected]
+        for component in reversed(cfg.sccs(nodes, self.out_edges)):
+            if not dirty.intersection(component):
+                continue
+            old = {n: self.out.get(n) for n in component}
+            self._solve(component, meter)
+            if meter is not None and meter.exhausted:
+                return
+            for n in component:
+                if self.out[n] != old[n]:
+                    dirty.update(self.out_edges[n])
+
+    def facts(self):
+        """Get the values at the start and end of every block, as a pair
+        of dicts, in program order.
+        """
+        if self.analysis.forward:
+            return self.in_, self.out
+        else:
+            return self.out, self.in_
+
+
+class InstrFacts(object):
+    """Data flow values at every point inside the blocks of a solved
+    analysis, computed on demand by replaying the transfer function one
+    instruction at a time from the value at the block's boundary.
+
+    The values for the `cache_size` most recently used blocks are kept;
+    call `invalidate` after updating the solution.
+    """
+    def __init__(self, solution, cache_size=16):
+        self.solution = solution
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+
+    def block(self, name):
+        """Get a list of the values at every point in a block: before
+        each instruction and then after the last one.
+        """
+        if name in self.cache:
+            self.cache.move_to_end(name)
+            return self.cache[name]
+
+        sol = self.solution
+        block = sol.blocks[name]
+        val = sol.in_[name]
+        points = [val]
+        order = block if sol.analysis.forward else reversed(block)
+        for instr in order:
+            val = sol.analysis.transfer([instr], val)
+            points.append(val)
+        if not sol.analysis.forward:
+            points.reverse()
+
+        self.cache[name] = points
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return points
+
+    def before(self, name, idx):
+        """Get the value just before instruction `idx` in a block.
+        """
+        return self.block(name)[idx]
+
+    def after(self, name, idx):
+        """Get the value just after instruction `idx` in a block.
+        """
+        return self.block(name)[idx + 1]
+
+    def invalidate(self, names=None):
+        """Forget the values for some blocks (or all of them).
+        """
+        if names is None:
+            self.cache.clear()
+        else:
+            for name in names:
+                self.cache.pop(name, None)
+
+
+def df_worklist(blocks, analysis, meter=None, graph=None):
+    """Solve a data flow analysis, producing the values at the start and
+    end of every block. `graph` is an optional `csr.Graph` for the
+    blocks.
+    """
+    return Solution(blocks, analysis, meter, graph).facts()
 
 
 def fmt(val):
@@ -80,17 +247,58 @@ def fmt(val):
         return str(val)
 
 
-def run_df(bril, analysis):
+def run_df(bril, analysis, budget=None, instrs=False):
+    """Print the values at the boundaries of every block or, with
+    `instrs`, after every instruction too.
+    """
     for func in bril['functions']:
         # Form the CFG.
         blocks = cfg.block_map(form_blocks(func['instrs']))
         cfg.add_terminators(blocks)
 
-        in_, out = df_worklist(blocks, analysis)
-        for block in blocks:
-            print('{}:'.format(block))
-            print('  in: ', fmt(in_[block]))
-            print('  out:', fmt(out[block]))
+        meter = budget.meter(func['name']) if budget is not None else None
+        print_facts(Solution(blocks, analysis, meter), instrs)
+
+
+def print_facts(solution, instrs=False):
+    """Print the values in a solution.
+    """
+    in_, out = solution.facts()
+    facts = InstrFacts(solution)
+    for block in solution.blocks:
+        print('{}:'.format(block))
+        print('  in: ', fmt(in_[block]))
+        if instrs:
+            for idx, instr in enumerate(solution.blocks[block]):
+                print('  {};'.format(instr_to_string(instr)))
+                print('    {}'.format(fmt(facts.after(block, idx))))
+        print('  out:', fmt(out[block]))
+
+
+def run_update(bril, analysis, name):
+    """Check incremental solving. In every function with a block called
+    `name`, solve the analysis, delete everything but the block's
+    terminator, and bring the solution up to date. Print the updated
+    values and the values solved from scratch, with the number of
+    transfer function applications each took.
+    """
+    for func in bril['functions']:
+        blocks = cfg.block_map(form_blocks(func['instrs']))
+        cfg.add_terminators(blocks)
+        if name not in blocks:
+            continue
+        solution = Solution(blocks, analysis)
+        blocks[name] = blocks[name][-1:]
+
+        meter = Budget().meter(func['name'])
+        solution.update([name], meter)
+        print('incremental ({} transfers):'.format(meter.transfers))
+        print_facts(solution)
+
+        meter = Budget().meter(func['name'])
+        scratch = Solution(blocks, analysis, meter)
+        print('from scratch ({} transfers):'.format(meter.transfers))
+        print_facts(scratch)
 
 
 def gen(block):
@@ -111,6 +319,18 @@ def use(block):
     return used
 
 
+def all_defs(blocks):
+    """Variables that are written anywhere.
+    """
+    return {i['dest'] for b in blocks.values() for i in b if 'dest' in i}
+
+
+def all_uses(blocks):
+    """Variables that are read anywhere.
+    """
+    return {v for b in blocks.values() for i in b for v in var_args(i)}
+
+
 def cprop_transfer(block, in_vals):
     out_vals = dict(in_vals)
     for instr in block:
@@ -145,6 +365,7 @@ ANALYSES = {
         init=set(),
         merge=union,
         transfer=lambda block, in_: in_.union(gen(block)),
+        widen=all_defs,
     ),
 
     # Live variable analysis: the variables that are both defined at a
@@ -154,17 +375,31 @@ ANALYSES = {
         init=set(),
         merge=union,
         transfer=lambda block, out: use(block).union(out - gen(block)),
+        widen=all_uses,
     ),
 
-    # A simple constant propagation pass.
+    # A simple constant propagation pass. (`sccp.py` is a faster and more
+    # precise alternative for optimization.)
     'cprop': Analysis(
         True,
         init={},
         merge=cprop_merge,
         transfer=cprop_transfer,
+        widen=lambda blocks: {v: '?' for v in all_defs(blocks)},
     ),
 }
 
+
+def main():
+    budget, args = budget_args(sys.argv[1:])
+    bril, args = load_program(args)
+    if '--clear' in args:
+        # Check incremental solving after clearing a block.
+        run_update(bril, ANALYSES[args[0]], args[args.index('--clear') + 1])
+    else:
+        run_df(bril, ANALYSES[args[0]], budget, '-i' in args)
+    report(budget)
+
+
 if __name__ == '__main__':
-    bril = json.load(sys.stdin)
-    run_df(bril, ANALYSES[sys.argv[1]])
+    main()
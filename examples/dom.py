@@ -1,8 +1,9 @@
-import json
 import sys
 
+from budget import budget_args, report
 from cfg import block_map, successors, add_terminators
 from form_blocks import form_blocks
+from funcindex import load_program
 
 
 def get_pred(succ):
@@ -19,14 +20,24 @@ def get_pred(succ):
 def postorder_helper(succ, root, explored, out):
     """Given a successor edge map, produce a list of all the nodes in
     the graph in postorder by appending to the `out` list.
+
+    The search uses an explicit stack, so it works on very deep graphs.
     """
     if root in explored:
         return
     explored.add(root)
 
-    for s in succ[root]:
-        postorder_helper(succ, s, explored, out)
-    out.append(root)
+    stack = [(root, iter(succ[root]))]
+    while stack:
+        node, it = stack[-1]
+        for s in it:
+            if s not in explored:
+                explored.add(s)
+                stack.append((s, iter(succ[s])))
+                break
+        else:
+            stack.pop()
+            out.append(node)
 
 
 def postorder(succ, root):
@@ -45,20 +56,51 @@ def intersect(sets):
     return out
 
 
-def get_dom(succ, entry):
+# With a budget, `get_dom` gives up when its dominator sets would hold
+# more than this many nodes in total. The sets take space quadratic in
+# the depth of the graph.
+MAX_DOM_SIZE = 1 << 22
+
+
+def get_dom(succ, entry, meter=None):
+    """Compute the dominators of every node reachable from `entry`. If
+    the `meter` runs out of budget, or the sets get too big (see
+    `MAX_DOM_SIZE`), fall back to the conservative answer that each node
+    is dominated only by itself and the entry.
+
+    `succ` can be any mapping from nodes to lists of successors, such as
+    the `succ_map` of a `csr.Graph`. For very large graphs, `csr.idoms`
+    computes immediate dominators without building a set per node.
+    """
     pred = get_pred(succ)
     nodes = list(reversed(postorder(succ, entry)))  # Reverse postorder.
 
-    dom = {v: set(nodes) for v in nodes}
+    # A node with no set yet could be dominated by anything, so it does
+    # not constrain the intersection. Every other node has a predecessor
+    # earlier in reverse postorder, so its first set is finite.
+    dom = {entry: {entry}}  # Even if there are jumps back to the entry.
+    size = 1
 
     while True:
         changed = False
 
-        for node in nodes:
-            new_dom = intersect(dom[p] for p in pred[node])
+        if meter is not None and not meter.spend(1):
+            return {v: {entry, v} for v in nodes}
+
+        for node in nodes[1:]:
+            if meter is not None and not meter.spend(0, 1):
+                return {v: {entry, v} for v in nodes}
+
+            new_dom = intersect(dom[p] for p in pred[node] if p in dom)
             new_dom.add(node)
 
-            if dom[node] != new_dom:
+            old_dom = dom.get(node)
+            if old_dom != new_dom:
+                if meter is not None:
+                    size += len(new_dom) - len(old_dom or ())
+                    if size > MAX_DOM_SIZE:
+                        meter.stop()
+                        return {v: {entry, v} for v in nodes}
                 dom[node] = new_dom
                 changed = True
 
@@ -68,14 +110,47 @@ def get_dom(succ, entry):
     return dom
 
 
-def print_dom(bril):
+def get_idom(dom):
+    """Given a dominator map, produce a map from every node to its
+    immediate dominator (None for the entry).
+    """
+    idom = {}
+    for node, doms in dom.items():
+        strict = [d for d in doms if d != node]
+        # The closest strict dominator is the one with the most dominators.
+        idom[node] = max(strict, key=lambda d: len(dom[d])) if strict \
+            else None
+    return idom
+
+
+def get_frontier(pred, idom):
+    """Compute the dominance frontier of every node, given a predecessor
+    edge map and an immediate dominator map. Nodes that are not in the
+    dominator tree (because they are unreachable) are ignored.
+    """
+    frontier = {node: set() for node in idom}
+    for node, ps in pred.items():
+        if node not in idom or len(ps) < 2:
+            continue
+        for p in ps:
+            runner = p
+            while runner in idom and runner != idom[node]:
+                frontier[runner].add(node)
+                runner = idom[runner]
+    return frontier
+
+
+def print_dom(bril, budget=None):
     for func in bril['functions']:
         blocks = block_map(form_blocks(func['instrs']))
         add_terminators(blocks)
         succ = {name: successors(block[-1]) for name, block in blocks.items()}
-        dom = get_dom(succ, list(blocks.keys())[0])
+        meter = budget.meter(func['name']) if budget is not None else None
+        dom = get_dom(succ, list(blocks.keys())[0], meter)
         print(dom)
 
 
 if __name__ == '__main__':
-    print_dom(json.load(sys.stdin))
+    budget, args = budget_args(sys.argv[1:])
+    print_dom(load_program(args)[0], budget)
+    report(budget)
@@ -0,0 +1,214 @@
+"""Random access to the functions in large Bril JSON files.
+
+An index is a sidecar file (`prog.json.idx` for `prog.json`) that
+records the byte offset and length of every function in the program.
+With an index, loading one function means seeking to it and parsing
+only its bytes. The index is built the first time it is needed and
+rebuilt whenever the program file changes.
+
+The index is a text file. The first line is a header with the size and
+modification time of the indexed file. Every other line holds a
+JSON-encoded function name, its offset, and its length, separated by
+tabs. The lines are sorted by name, so lookups are a binary search over
+the index file.
+
+Tools use `load_program` to accept `--function NAME` (to select a single
+function) and the name of a `.json` file to read instead of stdin.
+"""
+
+import json
+import os
+import re
+import sys
+
+HEADER = b'bril-index 1'
+
+WHITESPACE = re.compile(r'\s*')
+DECODER = json.JSONDecoder()
+
+
+def _skip(text, pos):
+    return WHITESPACE.match(text, pos).end()
+
+
+def _expect(text, pos, char):
+    pos = _skip(text, pos)
+    if text[pos:pos + 1] != char:
+        raise ValueError('expected {} at character {}'.format(char, pos))
+    return pos + 1
+
+
+def scan_functions(data):
+    """Find the functions in a Bril program's JSON text (as bytes).
+    Generate (name, offset, length) tuples, where the offset and length
+    are in bytes.
+    """
+    text = data.decode('utf8')
+
+    # Convert character positions to byte positions, remembering the
+    # last conversion so the total work is linear.
+    last = [0, 0]
+
+    def byte_pos(pos):
+        if len(text) == len(data):
+            return pos  # Pure ASCII.
+        last[1] += len(text[last[0]:pos].encode('utf8'))
+        last[0] = pos
+        return last[1]
+
+    pos = _expect(text, 0, '{')
+    while True:
+        pos = _skip(text, pos)
+        if text[pos:pos + 1] == '}':
+            return
+        key, pos = DECODER.raw_decode(text, pos)
+        pos = _skip(text, _expect(text, pos, ':'))
+
+        if key == 'functions':
+            pos = _expect(text, pos, '[')
+            while True:
+                pos = _skip(text, pos)
+                if text[pos:pos + 1] == ']':
+                    pos += 1
+                    break
+                func, end = DECODER.raw_decode(text, pos)
+                start = byte_pos(pos)
+                yield func['name'], start, byte_pos(end) - start
+                pos = _skip(text, end)
+                if text[pos:pos + 1] == ',':
+                    pos += 1
+        else:
+            _, pos = DECODER.raw_decode(text, pos)
+
+        pos = _skip(text, pos)
+        if text[pos:pos + 1] == ',':
+            pos += 1
+
+
+def _header(path):
+    st = os.stat(path)
+    return HEADER + ' {} {}\n'.format(st.st_size, st.st_mtime_ns).encode()
+
+
+def _entry_key(name):
+    return json.dumps(name).encode('utf8')
+
+
+def index_path(path):
+    return path + '.idx'
+
+
+def build_index(path):
+    """Scan a program file and write its index.
+    """
+    header = _header(path)
+    with open(path, 'rb') as f:
+        data = f.read()
+    lines = sorted(
+        b'\t'.join((_entry_key(name), str(offset).encode(),
+                    str(length).encode())) + b'\n'
+        for name, offset, length in scan_functions(data)
+    )
+    with open(index_path(path), 'wb') as f:
+        f.write(header)
+        f.writelines(lines)
+
+
+def _fresh_index(path):
+    """Open the index for a program file, building it first if it is
+    missing or out of date.
+    """
+    idx = index_path(path)
+    header = _header(path)
+    if os.path.exists(idx):
+        f = open(idx, 'rb')
+        if f.readline() == header:
+            return f
+        f.close()
+    build_index(path)
+    f = open(idx, 'rb')
+    f.readline()
+    return f
+
+
+def lookup(path, name):
+    """Find a function in the index for a program file. Return an
+    (offset, length) pair, or None if there is no such function.
+    """
+    key = _entry_key(name) + b'\t'
+    with _fresh_index(path) as f:
+        start = f.tell()
+        end = f.seek(0, os.SEEK_END)
+
+        # Binary search for the first line that sorts at or after the
+        # key. `lo` is always the start of a line.
+        lo, hi = start, end
+        while lo < hi:
+            mid = (lo + hi) // 2
+            f.seek(mid - 1)
+            f.readline()  # Move to the start of the next line.
+            pos = f.tell()
+            line = f.readline()
+            if not line or line >= key:
+                hi = mid
+            else:
+                lo = pos + len(line)
+
+        f.seek(lo)
+        line = f.readline()
+        if line.startswith(key):
+            _, offset, length = line.rsplit(b'\t', 2)
+            return int(offset), int(length)
+    return None
+
+
+def load_function(path, name):
+    """Load a single function from a program file using its index.
+    """
+    loc = lookup(path, name)
+    if loc is None:
+        raise KeyError('no function named {}'.format(name))
+    offset, length = loc
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        return json.loads(f.read(length).decode('utf8'))
+
+
+def load_program(args):
+    """Load the Bril program for a command-line tool. Remove the
+    `--function NAME` option and the input filename (any argument ending
+    in `.json`) from the list of arguments and return the program and
+    the remaining arguments.
+
+    With `--function`, the program contains only the selected function.
+    Without a filename, read the whole program from stdin.
+    """
+    args = list(args)
+    name = None
+    if '--function' in args:
+        idx = args.index('--function')
+        name = args[idx + 1]
+        del args[idx:idx + 2]
+    paths = [a for a in args if a.endswith('.json')]
+    args = [a for a in args if not a.endswith('.json')]
+
+    if paths and name is not None:
+        return {'functions': [load_function(paths[0], name)]}, args
+
+    if paths:
+        with open(paths[0]) as f:
+            bril = json.load(f)
+    else:
+        bril = json.load(sys.stdin)
+    if name is not None:
+        bril['functions'] = [f for f in bril['functions']
+                             if f['name'] == name]
+        if not bril['functions']:
+            raise KeyError('no function named {}'.format(name))
+    return bril, args
+
+
+if __name__ == '__main__':
+    # Build (or refresh) the index for each file on the command line.
+    for path in sys.argv[1:]:
+        build_index(path)
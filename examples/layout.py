@@ -0,0 +1,187 @@
+"""Basic block layout for Bril.
+
+Reorder the blocks in each function so that likely paths run straight
+through memory, and then delete the jumps that have become fall-throughs.
+Bril branches always name both of their targets, so only a `jmp` can turn
+into a fall-through. The pass links blocks into chains, greedily taking
+the most frequently executed jumps first, and lays the chains out one
+after another starting with the entry.
+
+Execution frequencies come from a profile when one is given with `-p
+FILE`: a JSON object mapping function names to objects that map block
+names to the number of times each block ran. Otherwise, the frequencies
+are estimated statically from the loop structure (every loop is assumed
+to run `LOOP_WEIGHT` times per entry) and from branch heuristics: a
+branch probably stays in its loop, and probably avoids a block that
+returns.
+"""
+
+import sys
+
+import briltxt
+import cfg
+from dom import postorder
+from form_blocks import form_blocks
+from loops import find_loops
+
+# How many times a loop is assumed to iterate.
+LOOP_WEIGHT = 10
+
+# The probability that a branch stays in its loop.
+LOOP_BRANCH_PROB = 0.88
+
+# The probability that a branch goes to a block that returns.
+RETURN_BRANCH_PROB = 0.28
+
+
+def branch_probs(blocks, name, innermost):
+    """Guess the probability of taking each outgoing edge from a block.
+    Produce a dict mapping successor names to probabilities.
+    """
+    succs = cfg.successors(blocks[name][-1])
+    if len(set(succs)) < 2:
+        return {s: 1.0 for s in succs}
+    a, b = succs
+
+    # Loop heuristic: stay in the innermost loop.
+    loop = innermost.get(name)
+    if loop is not None and (a in loop) != (b in loop):
+        p = LOOP_BRANCH_PROB if a in loop else 1 - LOOP_BRANCH_PROB
+        return {a: p, b: 1 - p}
+
+    # Return heuristic: avoid blocks that return.
+    a_ret = blocks[a][-1]['op'] == 'ret'
+    b_ret = blocks[b][-1]['op'] == 'ret'
+    if a_ret != b_ret:
+        p = RETURN_BRANCH_PROB if a_ret else 1 - RETURN_BRANCH_PROB
+        return {a: p, b: 1 - p}
+
+    return {a: 0.5, b: 0.5}
+
+
+def estimate_freqs(blocks):
+    """Estimate how often each block executes, relative to the entry.
+    """
+    loops = find_loops(blocks)
+    preds, succs = cfg.edges(blocks)
+    entry = list(blocks.keys())[0]
+
+    # The smallest loop containing each block.
+    innermost = {}
+    for header, body in loops.items():
+        for name in body:
+            if name not in innermost or len(body) < len(innermost[name]):
+                innermost[name] = body
+
+    probs = {name: branch_probs(blocks, name, innermost)
+             for name in blocks}
+
+    # Propagate frequencies along forward edges in reverse postorder,
+    # multiplying by the loop weight at every loop header.
+    freq = {name: 0.0 for name in blocks}
+    for name in reversed(postorder(succs, entry)):
+        total = 1.0 if name == entry else 0.0
+        for pred in preds[name]:
+            if not (name in loops and pred in loops[name]):
+                total += freq[pred] * probs[pred][name]
+        if name in loops:
+            total *= LOOP_WEIGHT
+        freq[name] = total
+    return freq
+
+
+def chain_blocks(blocks, freq, final=None):
+    """Group blocks into chains. A block that ends with `jmp` is followed
+    by its target whenever possible, preferring the most frequently
+    executed jumps and then jumps that were already fall-throughs.
+    Produce a list of chains (lists of block names) with the entry
+    first and the chain containing the `final` block (which can run off
+    the end of the function) last.
+    """
+    names = list(blocks.keys())
+    entry = names[0]
+    pos = {name: i for i, name in enumerate(names)}
+
+    jumps = []
+    for name, block in blocks.items():
+        last = block[-1]
+        if last['op'] == 'jmp' and last['args'][0] not in (name, entry):
+            jumps.append((name, last['args'][0]))
+    jumps.sort(key=lambda e: (-freq.get(e[0], 0),
+                              pos[e[1]] != pos[e[0]] + 1,
+                              pos[e[0]]))
+
+    chain_of = {name: [name] for name in names}
+    for src, dest in jumps:
+        a, b = chain_of[src], chain_of[dest]
+        if a is not b and a[-1] == src and b[0] == dest:
+            a += b
+            for name in b:
+                chain_of[name] = a
+
+    # The entry's chain comes first, then the hottest chains.
+    chains = []
+    for name in names:
+        if chain_of[name][0] == name:
+            chains.append(chain_of[name])
+    rest = sorted(chains[1:], key=lambda c: (final in c,
+                                             -freq.get(c[0], 0),
+                                             pos[c[0]]))
+    return chains[:1] + rest
+
+
+def layout_func(func, counts=None):
+    """Reorder the blocks in a function. `counts` optionally maps block
+    names to execution counts. Blocks that can never run are removed.
+    """
+    labels = {i['label'] for i in func['instrs'] if 'label' in i}
+    blocks = cfg.block_map(form_blocks(func['instrs']))
+    if not blocks:
+        return
+    sizes = {name: len(block) for name, block in blocks.items()}
+    final = list(blocks.keys())[-1]
+    cfg.add_terminators(blocks)
+
+    _, succs = cfg.edges(blocks)
+    reachable = set(postorder(succs, list(blocks.keys())[0]))
+    for name in list(blocks):
+        if name not in reachable:
+            del blocks[name]
+
+    freq = counts if counts is not None else estimate_freqs(blocks)
+    order = [name for chain in chain_blocks(blocks, freq, final)
+             for name in chain]
+
+    # Labels are needed for blocks that had them and for the targets of
+    # jumps that remain.
+    instrs = []
+    for i, name in enumerate(order):
+        block = list(blocks[name])
+        following = order[i + 1] if i + 1 < len(order) else None
+        last = block[-1]
+        if last['op'] == 'jmp' and last['args'][0] == following:
+            block.pop()
+        elif following is None and last['op'] == 'ret' and \
+                len(block) > sizes[name]:
+            block.pop()  # We added this return.
+        instrs.append((name, block))
+
+    targets = {t for _, block in instrs for i in block
+               if i.get('op') in ('jmp', 'br')
+               for t in cfg.successors(i)}
+    func['instrs'] = []
+    for name, block in instrs:
+        if name in labels or name in targets:
+            func['instrs'].append({'label': name})
+        func['instrs'] += block
+
+
+if __name__ == '__main__':
+    profile = {}
+    if '-p' in sys.argv:
+        with open(sys.argv[sys.argv.index('-p') + 1]) as f:
+            profile = briltxt.load(f)
+    bril = briltxt.load(sys.stdin)
+    for func in bril['functions']:
+        layout_func(func, profile.get(func['name']))
+    briltxt.dump(bril, sys.stdout)
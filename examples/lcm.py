@@ -0,0 +1,286 @@
+"""Partial redundancy elimination for Bril using lazy code motion.
+
+This follows the edge-based formulation of lazy code motion: it solves
+availability and anticipability with the `df` framework, finds the
+earliest and then the latest safe placement for every expression, and
+inserts computations on CFG edges so that redundant computations can be
+replaced with copies.
+
+Sets of expressions are represented as bit vectors (Python ints), with
+one bit for every distinct expression in the function.
+"""
+
+import sys
+
+import briltxt
+import cfg
+import df
+from form_blocks import form_blocks
+from util import fresh, var_args
+
+# Operations that never get moved.
+IGNORED_OPS = 'const', 'id'
+
+
+def expr(instr):
+    """Get the expression computed by an instruction, as a hashable
+    (op, type, args) tuple, or None if the instruction is not a
+    candidate for motion.
+    """
+    if 'dest' in instr and instr.get('args') and \
+            instr['op'] not in IGNORED_OPS:
+        return (instr['op'], instr['type'], tuple(instr['args']))
+    return None
+
+
+class Universe(object):
+    """The set of all expressions in a function, with a bit number for
+    each one and a record of which expressions use each variable.
+    """
+    def __init__(self, blocks):
+        self.bits = {}
+        self.exprs = []
+        self.users = {}
+        for block in blocks.values():
+            for instr in block:
+                e = expr(instr)
+                if e is not None and e not in self.bits:
+                    bit = 1 << len(self.exprs)
+                    self.bits[e] = bit
+                    self.exprs.append(e)
+                    for arg in e[2]:
+                        self.users[arg] = self.users.get(arg, 0) | bit
+        self.all = (1 << len(self.exprs)) - 1
+
+    def members(self, vec):
+        """Generate the expressions in a bit vector.
+        """
+        while vec:
+            low = vec & -vec
+            yield self.exprs[low.bit_length() - 1]
+            vec ^= low
+
+
+def local_sets(block, universe):
+    """Compute the upward-exposed, downward-exposed, and killed
+    expressions for a block, as bit vectors.
+    """
+    ue = de = kill = 0
+    for instr in block:
+        e = expr(instr)
+        if e is not None:
+            bit = universe.bits[e]
+            if not kill & bit:
+                ue |= bit
+            de |= bit
+        if 'dest' in instr:
+            killed = universe.users.get(instr['dest'], 0)
+            kill |= killed
+            de &= ~killed
+    return ue, de, kill
+
+
+def intersect_all(vecs, universe):
+    """Intersect a list of bit vectors. The intersection of no vectors
+    is empty: nothing holds before the entry or after an exit.
+    """
+    vecs = list(vecs)
+    if not vecs:
+        return 0
+    out = universe.all
+    for v in vecs:
+        out &= v
+    return out
+
+
+# These analyses have no `widen` value for running out of budget:
+# `placement` needs exact answers, because an approximate one can delete
+# computations without inserting them anywhere.
+
+def precomputed(blocks, universe):
+    """Compute the local sets for every block once. Produce a dict
+    mapping block names to the sets and a function that gets the sets
+    for a block (looking them up by identity, since transfer functions
+    get the block itself rather than its name).
+    """
+    local = {name: local_sets(block, universe)
+             for name, block in blocks.items()}
+    by_id = {id(block): local[name] for name, block in blocks.items()}
+
+    def lookup(block):
+        sets = by_id.get(id(block))
+        return sets if sets is not None else local_sets(block, universe)
+
+    return local, lookup
+
+
+def availability(universe, sets=None):
+    sets = sets or (lambda block: local_sets(block, universe))
+
+    def transfer(block, in_):
+        _, de, kill = sets(block)
+        return de | (in_ & ~kill)
+    return df.Analysis(
+        True,
+        init=universe.all,
+        merge=lambda vecs: intersect_all(vecs, universe),
+        transfer=transfer,
+    )
+
+
+def anticipability(universe, sets=None):
+    sets = sets or (lambda block: local_sets(block, universe))
+
+    def transfer(block, out):
+        ue, _, kill = sets(block)
+        return ue | (out & ~kill)
+    return df.Analysis(
+        False,
+        init=universe.all,
+        merge=lambda vecs: intersect_all(vecs, universe),
+        transfer=transfer,
+    )
+
+
+def placement(blocks, universe):
+    """Run the lazy code motion equations. Produce a dict mapping edges
+    ((pred, succ) pairs) to the expressions to insert on them and a dict
+    mapping blocks to the upward-exposed expressions to delete from
+    them.
+    """
+    preds, succs = cfg.edges(blocks)
+    entry = list(blocks.keys())[0]
+    local, sets = precomputed(blocks, universe)
+
+    _, avail_out = df.df_worklist(blocks, availability(universe, sets))
+    ant_in, ant_out = df.df_worklist(blocks, anticipability(universe, sets))
+
+    # The earliest edges where each expression could be placed.
+    earliest = {}
+    for i in blocks:
+        for j in succs[i]:
+            vec = ant_in[j] & ~avail_out[i]
+            if i != entry:
+                vec &= local[i][2] | ~ant_out[i]
+            earliest[i, j] = vec
+
+    # Push placements as late as possible, iterating to a fixed point.
+    later_in = {name: universe.all for name in blocks}
+    later_in[entry] = 0
+    later = {(i, j): earliest[i, j] | (later_in[i] & ~local[i][0])
+             for (i, j) in earliest}
+    worklist = list(blocks.keys())
+    while worklist:
+        j = worklist.pop()
+        if j == entry:
+            continue
+        vec = intersect_all((later[p, j] for p in preds[j]), universe)
+        if vec != later_in[j]:
+            later_in[j] = vec
+            for k in succs[j]:
+                later[j, k] = earliest[j, k] | (vec & ~local[j][0])
+                worklist.append(k)
+
+    insert = {}
+    for (i, j), vec in later.items():
+        vec &= ~later_in[j]
+        if vec:
+            insert[i, j] = vec
+    delete = {}
+    for name in blocks:
+        vec = local[name][0] & ~later_in[name]
+        if vec and name != entry:
+            delete[name] = vec
+
+    return insert, delete
+
+
+def lcm_func(func):
+    """Apply lazy code motion to a function. The function is left
+    untouched if there is nothing to move.
+    """
+    blocks = cfg.block_map(form_blocks(func['instrs']))
+    if not blocks:
+        return
+    cfg.add_terminators(blocks)
+
+    # Make sure nothing jumps back to the entry block, so it is a safe
+    # place to insert computations.
+    entry = list(blocks.keys())[0]
+    preds, _ = cfg.edges(blocks)
+    if preds[entry]:
+        cfg.insert_before(blocks, entry, fresh('entry', blocks),
+                          [{'op': 'jmp', 'args': [entry]}])
+
+    universe = Universe(blocks)
+    insert, delete = placement(blocks, universe)
+    if not delete:
+        return
+
+    # Every expression we touch gets a temporary variable.
+    names = {i['dest'] for b in blocks.values() for i in b if 'dest' in i}
+    names.update(a for b in blocks.values() for i in b for a in var_args(i))
+    moved = 0
+    for vec in delete.values():
+        moved |= vec
+    temps = {}
+    for e in universe.members(moved):
+        temps[e] = fresh('lcm.', names)
+        names.add(temps[e])
+
+    # Replace the deleted computations with copies and save the value of
+    # every downward-exposed computation in its temporary.
+    for name, block in blocks.items():
+        deleted = delete.get(name, 0)
+        killed = 0
+        last = {}
+        for idx, instr in enumerate(block):
+            e = expr(instr)
+            if e is not None and e in temps:
+                bit = universe.bits[e]
+                if deleted & bit and not killed & bit:
+                    instr.update({'op': 'id', 'args': [temps[e]]})
+                    deleted &= ~bit
+                else:
+                    last[e] = idx
+            if 'dest' in instr:
+                users = universe.users.get(instr['dest'], 0)
+                killed |= users
+                for e in universe.members(users):
+                    last.pop(e, None)
+        for e, idx in sorted(last.items(), key=lambda p: p[1],
+                             reverse=True):
+            instr = block[idx]
+            block[idx:idx + 1] = [
+                {'op': e[0], 'dest': temps[e], 'type': e[1],
+                 'args': list(e[2])},
+                {'op': 'id', 'dest': instr['dest'], 'type': e[1],
+                 'args': [temps[e]]},
+            ]
+
+    # Insert computations on edges, splitting them when necessary.
+    preds, succs = cfg.edges(blocks)
+    for (i, j), vec in insert.items():
+        vec &= moved
+        if not vec:
+            continue
+        new = [{'op': e[0], 'dest': temps[e], 'type': e[1],
+                'args': list(e[2])} for e in universe.members(vec)]
+        if len(succs[i]) == 1:
+            blocks[i][-1:-1] = new
+        elif len(preds[j]) == 1:
+            blocks[j][0:0] = new
+        else:
+            edge = fresh('lcm.edge.', blocks)
+            cfg.insert_before(blocks, j, edge,
+                              new + [{'op': 'jmp', 'args': [j]}])
+            cfg.retarget(blocks[i][-1], j, edge)
+
+    func['instrs'] = cfg.reassemble(blocks)
+
+
+if __name__ == '__main__':
+    bril = briltxt.load(sys.stdin)
+    for func in bril['functions']:
+        lcm_func(func)
+    briltxt.dump(bril, sys.stdout)
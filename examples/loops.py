@@ -0,0 +1,132 @@
+"""Find the natural loops in Bril functions.
+"""
+
+import sys
+from collections import namedtuple, OrderedDict
+
+import briltxt
+import cfg
+from dom import get_dom
+from form_blocks import form_blocks
+from util import fresh
+
+# A loop in a loop nest: its header, the set of blocks in its body, and
+# a list of the loops directly nested inside it.
+Loop = namedtuple('Loop', ['header', 'body', 'children'])
+
+
+def back_edges(succ, dom):
+    """Find all the back edges in a CFG: edges A -> B where B dominates
+    A. Produce a list of (tail, header) pairs.
+    """
+    out = []
+    for tail, ss in succ.items():
+        for header in ss:
+            if tail in dom and header in dom[tail]:
+                out.append((tail, header))
+    return out
+
+
+def natural_loop(preds, tail, header, dom):
+    """Get the set of blocks in the natural loop for the back edge from
+    `tail` to `header`: the header plus every block that can reach the
+    tail without going through the header. Unreachable blocks (which
+    are missing from the dominator map `dom`) are never in a loop.
+    """
+    body = {header}
+    stack = [tail]
+    while stack:
+        node = stack.pop()
+        if node not in body and node in dom:
+            body.add(node)
+            stack += preds[node]
+    return body
+
+
+def find_loops(blocks):
+    """Find the natural loops in a block map (whose blocks have
+    terminators). Loops sharing a header are merged. Produce an ordered
+    mapping from header names to the sets of blocks in each loop.
+    """
+    preds, succs = cfg.edges(blocks)
+    dom = get_dom(succs, list(blocks.keys())[0])
+
+    loops = OrderedDict()
+    for tail, header in back_edges(succs, dom):
+        body = natural_loop(preds, tail, header, dom)
+        loops.setdefault(header, set()).update(body)
+    return loops
+
+
+def loop_nest(order, succs, preds):
+    """Find the nesting structure of the loops in a CFG without computing
+    dominators, so it scales to very large functions. Every strongly
+    connected component with a cycle is a loop; its header is the first
+    block (in the sequence `order`) that is entered from outside, and
+    the loops nested inside are the cycles left when the header is
+    removed. For reducible CFGs, these are the natural loops (with loops
+    that share a header merged). Produce a list of `Loop`s.
+    """
+    pos = {name: i for i, name in enumerate(order)}
+
+    def nest(nodes):
+        loops = []
+        for component in reversed(cfg.sccs(nodes, succs)):
+            if len(component) == 1 and \
+                    component[0] not in succs[component[0]]:
+                continue  # Not a cycle.
+            body = set(component)
+            members = sorted(component, key=pos.get)
+            entries = [n for n in members
+                       if any(p not in body for p in preds[n])]
+            header = (entries or members)[0]
+            children = nest([n for n in members if n != header])
+            loops.append(Loop(header, body, children))
+        return loops
+
+    return nest(list(order))
+
+
+def insert_preheader(blocks, header, body):
+    """Add a new, empty block that runs just before the loop with the
+    given header and body is entered. Every edge into the header from
+    outside the loop is redirected to the preheader, which then jumps
+    to the header. Modify `blocks` in place and return the new block's
+    name.
+    """
+    name = fresh('{}.pre'.format(header), blocks)
+
+    # Redirect the loop entry edges.
+    for pred, block in blocks.items():
+        if pred not in body and header in cfg.successors(block[-1]):
+            cfg.retarget(block[-1], header, name)
+
+    # Put the new block right before the header, so a preheader for the
+    # entry block becomes the new entry.
+    cfg.insert_before(blocks, header, name,
+                      [{'op': 'jmp', 'args': [header]}])
+
+    return name
+
+
+def remove_empty_preheader(blocks, header, name):
+    """Undo `insert_preheader` if nothing was added to the preheader.
+    """
+    if len(blocks[name]) == 1:
+        for block in blocks.values():
+            if name in cfg.successors(block[-1]):
+                cfg.retarget(block[-1], name, header)
+        del blocks[name]
+
+
+def print_loops(bril):
+    for func in bril['functions']:
+        blocks = cfg.block_map(form_blocks(func['instrs']))
+        cfg.add_terminators(blocks)
+        print('{}:'.format(func['name']))
+        for header, body in find_loops(blocks).items():
+            print('  {}: {}'.format(header, ', '.join(sorted(body))))
+
+
+if __name__ == '__main__':
+    print_loops(briltxt.load(sys.stdin))
@@ -1,9 +1,9 @@
 """Local value numbering for Bril.
 """
-import json
 import sys
 from collections import namedtuple
 
+import briltxt
 from form_blocks import form_blocks, TERMINATORS
 from util import flatten, var_args
 
@@ -236,7 +236,11 @@ def lvn(bril, prop=False, canon=False, fold=False):
         func['instrs'] = flatten(blocks)
 
 
-if __name__ == '__main__':
-    bril = json.load(sys.stdin)
+def main():
+    bril = briltxt.load(sys.stdin)
     lvn(bril, '-p' in sys.argv, '-c' in sys.argv, '-f' in sys.argv)
-    json.dump(bril, sys.stdout, indent=2, sort_keys=True)
+    briltxt.dump(bril, sys.stdout)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,427 @@
+"""Sparse conditional constant propagation for Bril.
+
+This is the algorithm of Wegman and Zadeck. Values flow along def-use
+edges instead of being copied around in per-block maps: the pass builds
+an SSA-style graph for the function (placing merge points, or phi nodes,
+at dominance frontiers) without rewriting the function into SSA form.
+It then evaluates instructions with the same semantics as the reference
+interpreter, only considering CFG edges that can actually execute.
+
+Every definition gets a lattice value: None if nothing is known yet
+(either it never executes or all its inputs are undefined), a constant,
+or VARYING. Reading a variable that has no definition is assumed not to
+happen, so undefined inputs are ignored.
+
+In rewrite mode, definitions with constant values become `const`
+instructions, branches with constant conditions become jumps, and
+blocks that can never execute are removed.
+"""
+
+import math
+import struct
+import sys
+
+import briltxt
+import cfg
+from dom import get_dom, get_frontier, get_idom
+from form_blocks import form_blocks
+from util import var_args
+
+VARYING = '?'
+
+# The largest integer that survives a round trip through a JSON number.
+MAX_SAFE_INT = 2 ** 53
+
+
+def is_int(v):
+    return isinstance(v, int) and not isinstance(v, bool)
+
+
+def same(a, b):
+    """Check whether two lattice values are identical. (Python considers
+    `1 == True` and `0.0 == -0.0`, but the interpreter does not.)
+    """
+    return type(a) is type(b) and repr(a) == repr(b)
+
+
+def meet(a, b):
+    if a is None:
+        return b
+    elif b is None or same(a, b):
+        return a
+    else:
+        return VARYING
+
+
+def fround(x):
+    """Round a number to single precision, like JavaScript's
+    `Math.fround`.
+    """
+    try:
+        return struct.unpack('f', struct.pack('f', x))[0]
+    except OverflowError:
+        return math.copysign(math.inf, x)
+
+
+def int_div(a, b):
+    # Round toward zero, like JavaScript's BigInt division.
+    q = abs(a) // abs(b)
+    return q if (a >= 0) == (b >= 0) else -q
+
+
+def float_div(a, b):
+    # IEEE division, including division by zero.
+    if b == 0:
+        if a == 0 or math.isnan(a):
+            return math.nan
+        return math.copysign(math.inf, a) * math.copysign(1.0, b)
+    return a / b
+
+
+# Operations that take one argument. Everything else takes two.
+UNARY = 'not', 'id'
+
+# Foldable operations: the type every argument must have and a function
+# computing the result (or None if the interpreter would fail).
+FOLDERS = {
+    'add': (is_int, lambda a, b: a + b),
+    'mul': (is_int, lambda a, b: a * b),
+    'sub': (is_int, lambda a, b: a - b),
+    'div': (is_int, lambda a, b: None if b == 0 else int_div(a, b)),
+    'eq': (is_int, lambda a, b: a == b),
+    'lt': (is_int, lambda a, b: a < b),
+    'gt': (is_int, lambda a, b: a > b),
+    'le': (is_int, lambda a, b: a <= b),
+    'ge': (is_int, lambda a, b: a >= b),
+    'not': (lambda v: isinstance(v, bool), lambda a: not a),
+    'and': (lambda v: isinstance(v, bool), lambda a, b: a and b),
+    'or': (lambda v: isinstance(v, bool), lambda a, b: a or b),
+    'fadd': (lambda v: isinstance(v, float), lambda a, b: a + b),
+    'fmul': (lambda v: isinstance(v, float), lambda a, b: a * b),
+    'fsub': (lambda v: isinstance(v, float), lambda a, b: a - b),
+    'fdiv': (lambda v: isinstance(v, float), float_div),
+    'feq': (lambda v: isinstance(v, float), lambda a, b: a == b),
+    'flt': (lambda v: isinstance(v, float), lambda a, b: a < b),
+    'fle': (lambda v: isinstance(v, float), lambda a, b: a <= b),
+    'fgt': (lambda v: isinstance(v, float), lambda a, b: a > b),
+    'fge': (lambda v: isinstance(v, float), lambda a, b: a >= b),
+    'id': (lambda v: True, lambda a: a),
+}
+
+
+def const_value(instr):
+    """Get the value a `const` instruction produces in the interpreter.
+    """
+    value = instr['value']
+    if instr['type'] in ('float', 'double'):
+        value = float(value)
+        return fround(value) if instr['type'] == 'float' else value
+    elif is_int(value) or isinstance(value, float):
+        return int(math.floor(value))
+    return value
+
+
+def evaluate(instr, vals):
+    """Compute the lattice value of an instruction's result given the
+    values of its arguments. Anything that would be an error in the
+    interpreter (like division by zero) is VARYING, so it stays in the
+    program.
+    """
+    op = instr['op']
+    if op == 'const':
+        return const_value(instr)
+    if any(v is None for v in vals):
+        return None
+    if op not in FOLDERS or any(v is VARYING for v in vals):
+        return VARYING
+
+    check, fold = FOLDERS[op]
+    arity = 1 if op in UNARY else 2
+    if len(vals) != arity or not all(check(v) for v in vals):
+        return VARYING
+    result = fold(*vals)
+    if result is None:
+        return VARYING
+    if isinstance(result, float) and instr['type'] == 'float':
+        result = fround(result)
+    return result
+
+
+class Graph(object):
+    """The sparse evaluation graph for a function. Nodes are numbered:
+    there is one for every instruction and one for every phi. For each
+    node, `args` has the nodes that define its arguments (for a phi, a
+    dict keyed by predecessor block) and `users` has the nodes that use
+    its value.
+    """
+    def __init__(self, blocks):
+        self.blocks = blocks
+        self.entry = list(blocks.keys())[0]
+        preds, self.succs = cfg.edges(blocks)
+        preds[self.entry] = [None] + preds[self.entry]  # Function entry.
+
+        self.block = []  # The block containing each node.
+        self.instr = []  # The instruction for each node (or None).
+        self.var = []  # The variable for each phi (or None).
+        self.args = []
+        self.users = []
+
+        # Number the instructions.
+        self.instr_nodes = {}
+        for name, block in blocks.items():
+            self.instr_nodes[name] = [self._node(name, i, None, [])
+                                      for i in block]
+
+        dom = get_dom(self.succs, self.entry)
+        idom = get_idom(dom)
+        self._place_phis(get_frontier(preds, idom))
+        self._rename(idom)
+
+    def _node(self, block, instr, var, args):
+        self.block.append(block)
+        self.instr.append(instr)
+        self.var.append(var)
+        self.args.append(args)
+        self.users.append([])
+        return len(self.block) - 1
+
+    def _place_phis(self, frontier):
+        """Insert phi nodes for every variable at the iterated dominance
+        frontier of its definitions.
+        """
+        defsites = {}
+        for name, block in self.blocks.items():
+            if name in frontier:
+                for instr in block:
+                    if 'dest' in instr:
+                        defsites.setdefault(instr['dest'], set()).add(name)
+
+        self.phis = {name: {} for name in self.blocks}
+        for var, sites in sorted(defsites.items()):
+            work = sorted(sites)
+            while work:
+                site = work.pop()
+                for name in sorted(frontier[site]):
+                    if var not in self.phis[name]:
+                        self.phis[name][var] = self._node(name, None, var, {})
+                        if name not in sites:
+                            sites.add(name)
+                            work.append(name)
+
+    def _use(self, user, defn):
+        if defn is not None:
+            self.users[defn].append(user)
+        return defn
+
+    def _rename(self, idom):
+        """Connect every use to its reachable definition by walking the
+        dominator tree.
+        """
+        children = {name: [] for name in idom}
+        for name in self.blocks:
+            if idom.get(name) is not None:
+                children[idom[name]].append(name)
+
+        current = {}  # Stacks of definitions for each variable.
+        stack = [('enter', self.entry)]
+        while stack:
+            action, item = stack.pop()
+            if action == 'exit':
+                for var in item:
+                    current[var].pop()
+                continue
+
+            name = item
+            pushed = []
+            for var, node in self.phis[name].items():
+                current.setdefault(var, []).append(node)
+                pushed.append(var)
+            for instr, node in zip(self.blocks[name],
+                                   self.instr_nodes[name]):
+                for arg in var_args(instr):
+                    defs = current.get(arg)
+                    self.args[node].append(
+                        self._use(node, defs[-1] if defs else None)
+                    )
+                if 'dest' in instr:
+                    current.setdefault(instr['dest'], []).append(node)
+                    pushed.append(instr['dest'])
+            for succ in self.succs[name]:
+                for var, phi in self.phis[succ].items():
+                    defs = current.get(var)
+                    self.args[phi][name] = \
+                        self._use(phi, defs[-1] if defs else None)
+
+            stack.append(('exit', pushed))
+            for child in reversed(children[name]):
+                stack.append(('enter', child))
+
+
+def sccp(blocks):
+    """Run sparse conditional constant propagation on a block map (whose
+    blocks have terminators). Return the graph, a list of lattice values
+    for its nodes, and the set of blocks that can execute.
+    """
+    graph = Graph(blocks)
+    value = [None] * len(graph.block)
+    edges = set()
+    executable = set()
+    flow = [(None, graph.entry)]
+    ssa = []
+
+    def visit(node):
+        instr = graph.instr[node]
+        if instr is None:
+            # A phi: merge the values along the edges that can execute.
+            new = None
+            for pred, defn in graph.args[node].items():
+                if (pred, graph.block[node]) in edges and defn is not None:
+                    new = meet(new, value[defn])
+        elif 'dest' in instr:
+            new = evaluate(instr, [None if d is None else value[d]
+                                   for d in graph.args[node]])
+        else:
+            # Effect operations: only control flow matters.
+            name = graph.block[node]
+            targets = []
+            if instr['op'] == 'br':
+                cond = graph.args[node][0]
+                cond = None if cond is None else value[cond]
+                if isinstance(cond, bool):
+                    targets = [instr['args'][1 if cond else 2]]
+                elif cond is not None:
+                    targets = instr['args'][1:]
+            elif instr['op'] == 'jmp':
+                targets = instr['args']
+            flow.extend((name, t) for t in targets)
+            return
+
+        new = meet(value[node], new)
+        if not same(new, value[node]):
+            value[node] = new
+            ssa.extend(graph.users[node])
+
+    while True:
+        while flow or ssa:
+            if flow:
+                edge = flow.pop()
+                if edge in edges:
+                    continue
+                edges.add(edge)
+                name = edge[1]
+                for node in graph.phis[name].values():
+                    visit(node)
+                if name not in executable:
+                    executable.add(name)
+                    for node in graph.instr_nodes[name]:
+                        visit(node)
+            else:
+                node = ssa.pop()
+                if graph.block[node] in executable:
+                    visit(node)
+
+        # A branch on a value that is never defined would be an error,
+        # but keep both of its targets so the CFG stays well formed.
+        for name in blocks:
+            node = graph.instr_nodes[name][-1]
+            instr = graph.instr[node]
+            if name in executable and instr['op'] == 'br':
+                cond = graph.args[node][0]
+                if cond is None or value[cond] is None:
+                    flow.extend((name, t) for t in instr['args'][1:]
+                                if (name, t) not in edges)
+        if not flow:
+            break
+
+    return graph, value, executable
+
+
+def representable(value, typ):
+    """Check whether a constant can be written as a `const` instruction
+    of the given type that produces exactly that value.
+    """
+    if typ == 'bool':
+        return isinstance(value, bool)
+    elif typ == 'int':
+        return is_int(value) and abs(value) <= MAX_SAFE_INT
+    elif typ in ('float', 'double'):
+        return isinstance(value, float) and math.isfinite(value)
+    return False
+
+
+def sccp_func(func):
+    """Replace constant computations in a function with `const`
+    instructions and remove branches and blocks that never execute.
+    Everything else, including the order of the blocks, stays as it was.
+    """
+    labels = {i['label'] for i in func['instrs'] if 'label' in i}
+    blocks = cfg.block_map(form_blocks(func['instrs']))
+    if not blocks:
+        return
+    sizes = {name: len(block) for name, block in blocks.items()}
+    cfg.add_terminators(blocks)
+    graph, value, executable = sccp(blocks)
+
+    instrs = []
+    for name, block in blocks.items():
+        if name not in executable:
+            continue
+        if name in labels:
+            instrs.append({'label': name})
+
+        # Leave out the terminators that were added for the analysis.
+        for instr, node in zip(block[:sizes[name]],
+                               graph.instr_nodes[name]):
+            val = value[node]
+            if 'dest' in instr and instr['op'] != 'const' and \
+                    representable(val, instr['type']):
+                instr = {'op': 'const', 'dest': instr['dest'],
+                         'type': instr['type'], 'value': val}
+            elif instr['op'] == 'br':
+                cond = graph.args[node][0]
+                if cond is not None and isinstance(value[cond], bool):
+                    target = instr['args'][1 if value[cond] else 2]
+                    instr = {'op': 'jmp', 'args': [target]}
+            instrs.append(instr)
+
+    func['instrs'] = instrs
+
+
+def _fmt_value(val):
+    if isinstance(val, bool):
+        return str(val).lower()
+    return str(val)
+
+
+def print_consts(bril):
+    """Print the constant variables defined in every block, and which
+    blocks can never execute.
+    """
+    for func in bril['functions']:
+        blocks = cfg.block_map(form_blocks(func['instrs']))
+        if not blocks:
+            continue
+        cfg.add_terminators(blocks)
+        graph, value, executable = sccp(blocks)
+        print('{}:'.format(func['name']))
+        for name, block in blocks.items():
+            if name not in executable:
+                print('  {}: unreachable'.format(name))
+                continue
+            consts = []
+            for instr, node in zip(block, graph.instr_nodes[name]):
+                val = value[node]
+                if 'dest' in instr and val is not None and val is not VARYING:
+                    consts.append('{} = {}'.format(
+                        instr['dest'], _fmt_value(val)))
+            print('  {}: {}'.format(name, ', '.join(consts)))
+
+
+if __name__ == '__main__':
+    bril = briltxt.load(sys.stdin)
+    if sys.argv[1:] == ['consts']:
+        print_consts(bril)
+    else:
+        for func in bril['functions']:
+            sccp_func(func)
+        briltxt.dump(bril, sys.stdout)
@@ -0,0 +1,65 @@
+#!/bin/sh
+# Run a tool through bril_server.py and bril_client.py, print what the
+# client wrote to stdout and stderr, and check that it matches the
+# standalone command.
+#
+#     compare.sh FILE [VAR=VALUE...] TOOL [ARGS...]
+#
+# FILE is a program in the text format (converted to JSON for tools
+# other than `parse`). The input is also saved as `prog.json` in the
+# directory where the commands run, which is not the server's. The
+# variables are set for the client but not for the server, which should
+# get them from the client.
+
+file=$1
+shift
+vars=
+while case $1 in *=*) true ;; *) false ;; esac; do
+    vars="$vars $1"
+    shift
+done
+tool=$1
+shift
+case $tool in
+    parse) cmd=bril2json ;;
+    print) cmd=bril2txt ;;
+    *) cmd="python3 $PWD/../$tool.py" ;;
+esac
+
+examples=$PWD/..
+file=$PWD/$file
+tmp=$(mktemp -d)
+export BRIL_SOCKET=$tmp/sock
+(cd / && exec python3 "$examples/bril_server.py" 1) &
+server=$!
+while [ ! -S "$BRIL_SOCKET" ]; do
+    sleep 0.1
+done
+
+if [ "$tool" = parse ]; then
+    cp "$file" "$tmp/in"
+else
+    bril2json < "$file" > "$tmp/in"
+fi
+mkdir "$tmp/work"
+cp "$tmp/in" "$tmp/work/prog.json"
+cd "$tmp/work"
+for v in $vars; do
+    export "$v"
+done
+
+$cmd "$@" < "$tmp/in" > "$tmp/out.cmd" 2> "$tmp/err.cmd"
+echo "status: $?" >> "$tmp/err.cmd"
+python3 "$examples/bril_client.py" "$tool" "$@" < "$tmp/in" > "$tmp/out" 2> "$tmp/err"
+echo "status: $?" >> "$tmp/err"
+
+kill "$server"
+wait "$server"
+cd /
+
+cat "$tmp/out"
+printf "\n--- stderr\n"
+cat "$tmp/err"
+cmp -s "$tmp/out" "$tmp/out.cmd" || echo "stdout differs from $cmd"
+cmp -s "$tmp/err" "$tmp/err.cmd" || echo "stderr differs from $cmd"
+rm -rf "$tmp"
@@ -0,0 +1,306 @@
+"""Induction variable detection and strength reduction for Bril.
+
+A *basic* induction variable has exactly one definition in a loop, of
+the form `i = add i s` (or `add s i` or `sub i s`) where the step `s`
+is loop-invariant. A *derived* induction variable has one definition in
+the loop that adds, subtracts, or multiplies another induction variable
+and a loop-invariant value.
+
+Strength reduction replaces every `j = mul i c` in a loop, where `i` is a
+basic induction variable and `c` is invariant, with a copy from a new
+variable `t`. `t` is set to `i * c` in the loop's preheader and updated
+with `t = add t (s * c)` right after every update to `i`, so the loop
+body performs an addition where it used to perform a multiplication.
+
+On its own, the pass makes loops longer: each `mul` becomes a copy, and
+there is a new `add`. Run `lvn.py -p` and `tdce.py` afterward to remove
+the copies. Then every iteration runs the same number of instructions
+as before, with an `add` in place of each `mul`. Iterations get shorter
+only when instructions that just fed the multiplication become dead
+(an invariant operand now computed in the preheader, or a `mul` in an
+inner loop where the outer loop's induction variable does not change).
+The tests in `sr_profile_test` compare dynamic instruction counts with
+and without the pass.
+"""
+
+import sys
+from collections import namedtuple
+
+import briltxt
+import cfg
+import df
+from dom import get_dom, intersect
+from form_blocks import form_blocks
+from loops import find_loops, insert_preheader, remove_empty_preheader
+from util import fresh, var_args
+
+# A basic induction variable: `var` is updated at `site` (a (block,
+# index) pair) by adding or subtracting (`op`) the invariant `step`.
+BasicIV = namedtuple('BasicIV', ['var', 'site', 'op', 'step'])
+
+# A derived induction variable: `var` is defined at `site` as `op`
+# applied to the induction variable `base` and the invariant `operand`.
+DerivedIV = namedtuple('DerivedIV', ['var', 'site', 'op', 'base', 'operand'])
+
+
+def loop_defs(blocks, body):
+    """Map every variable written inside a loop to the list of sites
+    that write it.
+    """
+    defs = {}
+    for name in blocks:
+        if name not in body:
+            continue
+        for idx, instr in enumerate(blocks[name]):
+            if 'dest' in instr:
+                defs.setdefault(instr['dest'], []).append((name, idx))
+    return defs
+
+
+def dominates(dom, a, b):
+    """Check whether the instruction at site `a` runs before the one at
+    site `b` on every path to `b`.
+    """
+    if a[0] == b[0]:
+        return a[1] < b[1]
+    return a[0] in dom[b[0]]
+
+
+def invariant(var, site, blocks, defs, dom):
+    """Check whether `var` has the same value every time control reaches
+    `site` in the loop described by `defs`. Return the variable name if
+    it is never written in the loop, the `const` instruction if its only
+    in-loop definition is a constant that always runs first, or None.
+    """
+    sites = defs.get(var, [])
+    if not sites:
+        return var
+    if len(sites) == 1 and dominates(dom, sites[0], site):
+        instr = blocks[sites[0][0]][sites[0][1]]
+        if instr['op'] == 'const':
+            return instr
+    return None
+
+
+def find_ivs(blocks, body, dom):
+    """Find the basic and derived induction variables in a loop.
+    Produce two dicts mapping variable names to `BasicIV` and
+    `DerivedIV` tuples.
+    """
+    defs = loop_defs(blocks, body)
+
+    # Single-definition variables are the only candidates.
+    single = {}
+    for var, sites in defs.items():
+        if len(sites) == 1:
+            site = sites[0]
+            single[var] = (site, blocks[site[0]][site[1]])
+
+    basic = {}
+    for var, (site, instr) in single.items():
+        args = instr.get('args', [])
+        if instr['op'] == 'add' and args.count(var) == 1:
+            step = args[1] if args[0] == var else args[0]
+        elif instr['op'] == 'sub' and args[0] == var and args[1] != var:
+            step = args[1]
+        else:
+            continue
+        step = invariant(step, site, blocks, defs, dom)
+        if step is not None:
+            basic[var] = BasicIV(var, site, instr['op'], step)
+
+    # Grow the set of derived variables until nothing changes.
+    derived = {}
+    changed = True
+    while changed:
+        changed = False
+        for var, (site, instr) in single.items():
+            if var in basic or var in derived:
+                continue
+            if instr['op'] not in ('add', 'sub', 'mul'):
+                continue
+            args = instr['args']
+            for base, other in (args, reversed(args)):
+                if base not in basic and base not in derived:
+                    continue
+                if instr['op'] == 'sub' and base != args[0]:
+                    continue
+                operand = invariant(other, site, blocks, defs, dom)
+                if operand is not None:
+                    derived[var] = DerivedIV(var, site, instr['op'],
+                                             base, operand)
+                    changed = True
+                    break
+
+    return basic, derived
+
+
+def must_defined(blocks):
+    """Find the variables that are definitely assigned on every path
+    into and out of every block.
+    """
+    analysis = df.Analysis(
+        True,
+        init=df.all_defs(blocks),
+        merge=intersect,
+        transfer=lambda block, in_: in_.union(df.gen(block)),
+        widen=lambda blocks: set(),
+    )
+    return df.df_worklist(blocks, analysis)
+
+
+def _materialize(value, pre, names):
+    """Get a variable holding an invariant value (as returned by
+    `invariant`) in a preheader, adding a fresh `const` if necessary.
+    """
+    if isinstance(value, str):
+        return value
+    var = fresh('sr.', names)
+    names.add(var)
+    pre.insert(-1, {'op': 'const', 'dest': var, 'type': value['type'],
+                    'value': value['value']})
+    return var
+
+
+def _invariant_key(value):
+    if isinstance(value, str):
+        return value
+    return ('const', value['value'])
+
+
+def reduce_loop(blocks, header, body, pre, dom, defined, names):
+    """Strength-reduce the multiplications by basic induction variables
+    in one loop. `pre` is the name of the loop's preheader. Return the
+    number of instructions replaced.
+    """
+    basic, _ = find_ivs(blocks, body, dom)
+    defs = loop_defs(blocks, body)
+    pre_block = blocks[pre]
+    avail = defined[pre]
+
+    # Find the candidate multiplications first, so inserting updates
+    # does not disturb the sites we are working with.
+    candidates = []
+    for name in blocks:
+        if name not in body:
+            continue
+        for idx, instr in enumerate(blocks[name]):
+            if instr['op'] != 'mul':
+                continue
+            args = instr['args']
+            for iv, other in (args, reversed(args)):
+                if iv not in basic:
+                    continue
+                factor = invariant(other, (name, idx), blocks, defs, dom)
+                if factor is None:
+                    continue
+                step = basic[iv].step
+                if iv not in avail or \
+                        any(isinstance(v, str) and v not in avail
+                            for v in (factor, step)):
+                    continue
+                candidates.append((instr, basic[iv], factor))
+                break
+
+    reduced = {}
+    updates = []
+    for instr, iv, factor in candidates:
+        key = (iv.var, _invariant_key(factor))
+        if key not in reduced:
+            # Initialize the new variable and its increment.
+            factor_var = _materialize(factor, pre_block, names)
+            step_var = _materialize(iv.step, pre_block, names)
+            var = fresh('sr.', names)
+            inc = fresh('sr.', names | {var})
+            names.update((var, inc))
+            pre_block[-1:-1] = [
+                {'op': 'mul', 'dest': var, 'type': 'int',
+                 'args': [iv.var, factor_var]},
+                {'op': 'mul', 'dest': inc, 'type': 'int',
+                 'args': [step_var, factor_var]},
+            ]
+            reduced[key] = var
+            updates.append((iv.site, {'op': iv.op, 'dest': var,
+                                      'type': 'int', 'args': [var, inc]}))
+
+        # Replace the multiplication with a copy.
+        instr.update({'op': 'id', 'args': [reduced[key]]})
+
+    # Insert the updates after the induction variable changes, from the
+    # back of each block so the indices stay valid.
+    for (name, idx), update in sorted(updates, key=lambda u: u[0],
+                                      reverse=True):
+        blocks[name].insert(idx + 1, update)
+
+    return len(candidates)
+
+
+def strength_reduce(func):
+    """Apply strength reduction to every loop in a function. The
+    function is left untouched if there is nothing to reduce.
+    """
+    blocks = cfg.block_map(form_blocks(func['instrs']))
+    if not blocks:
+        return
+    cfg.add_terminators(blocks)
+
+    # Give every loop a preheader, then recompute the loops and
+    # dominators for the modified CFG.
+    preheaders = {header: insert_preheader(blocks, header, body)
+                  for header, body in find_loops(blocks).items()}
+    loops = find_loops(blocks)
+    _, succs = cfg.edges(blocks)
+    dom = get_dom(succs, list(blocks.keys())[0])
+    _, defined = must_defined(blocks)
+
+    names = {i['dest'] for b in blocks.values() for i in b if 'dest' in i}
+    names.update(a for b in blocks.values() for i in b for a in var_args(i))
+
+    # Reduce inner loops first.
+    count = 0
+    for header, body in sorted(loops.items(), key=lambda l: len(l[1])):
+        count += reduce_loop(blocks, header, body, preheaders[header],
+                             dom, defined, names)
+
+    for header, pre in preheaders.items():
+        remove_empty_preheader(blocks, header, pre)
+
+    if count:
+        func['instrs'] = cfg.reassemble(blocks)
+
+
+def _fmt_value(value):
+    if isinstance(value, str):
+        return value
+    return str(value['value']).lower()
+
+
+def print_ivs(bril):
+    """Print the induction variables of every loop in a program.
+    """
+    for func in bril['functions']:
+        blocks = cfg.block_map(form_blocks(func['instrs']))
+        cfg.add_terminators(blocks)
+        _, succs = cfg.edges(blocks)
+        dom = get_dom(succs, list(blocks.keys())[0])
+
+        print('{}:'.format(func['name']))
+        for header, body in find_loops(blocks).items():
+            basic, derived = find_ivs(blocks, body, dom)
+            print('  {}:'.format(header))
+            for _, iv in sorted(basic.items()):
+                print('    basic {}: {} {}'.format(
+                    iv.var, iv.op, _fmt_value(iv.step)))
+            for _, iv in sorted(derived.items()):
+                print('    derived {}: {} {} {}'.format(
+                    iv.var, iv.op, iv.base, _fmt_value(iv.operand)))
+
+
+if __name__ == '__main__':
+    bril = briltxt.load(sys.stdin)
+    if sys.argv[1:] == ['ivs']:
+        print_ivs(bril)
+    else:
+        for func in bril['functions']:
+            strength_reduce(func)
+        briltxt.dump(bril, sys.stdout)
@@ -3,7 +3,8 @@ local optimization.
 """
 
 import sys
-import json
+import briltxt
+from budget import budget_args, report
 from form_blocks import form_blocks
 from util import flatten, var_args
 
@@ -45,12 +46,12 @@ def trivial_dce_pass(func):
     return changed
 
 
-def trivial_dce(func):
+def trivial_dce(func, meter=None):
     """Iteratively remove dead instructions, stopping when nothing
-    remains to remove.
+    remains to remove (or when the `meter` runs out of budget).
     """
     # An exercise for the reader: prove that this loop terminates.
-    while trivial_dce_pass(func):
+    while (meter is None or meter.spend(1)) and trivial_dce_pass(func):
         pass
 
 
@@ -105,10 +106,11 @@ def drop_killed_pass(func):
     return changed
 
 
-def trivial_dce_plus(func):
+def trivial_dce_plus(func, meter=None):
     """Like `trivial_dce`, but also deletes locally killed instructions.
     """
-    while trivial_dce_pass(func) or drop_killed_pass(func):
+    while (meter is None or meter.spend(1)) and \
+            (trivial_dce_pass(func) or drop_killed_pass(func)):
         pass
 
 
@@ -119,18 +121,26 @@ MODES = {
     'tdce+': trivial_dce_plus,
 }
 
+# The modes that iterate and so can be given a budget.
+ITERATIVE = trivial_dce, trivial_dce_plus
+
 
 def localopt():
-    if len(sys.argv) > 1:
-        modify_func = MODES[sys.argv[1]]
+    budget, args = budget_args(sys.argv[1:])
+    if args:
+        modify_func = MODES[args[0]]
     else:
         modify_func = trivial_dce
 
     # Apply the change to all the functions in the input program.
-    bril = json.load(sys.stdin)
+    bril = briltxt.load(sys.stdin)
     for func in bril['functions']:
-        modify_func(func)
-    json.dump(bril, sys.stdout, indent=2, sort_keys=True)
+        if budget is not None and modify_func in ITERATIVE:
+            modify_func(func, budget.meter(func['name']))
+        else:
+            modify_func(func)
+    briltxt.dump(bril, sys.stdout)
+    report(budget)
 
 
 if __name__ == '__main__':
@@ -26,10 +26,11 @@ def var_args(instr):
         return []
 
 
-def fresh(seed, names):
-    """Generate a new name that is not in `names` starting with `seed`.
+def fresh(seed, names, start=1):
+    """Generate a new name that is not in `names` starting with `seed`,
+    numbered `start` or higher.
     """
-    i = 1
+    i = start
     while True:
         name = seed + str(i)
         if name not in names:
@@ -0,0 +1,45 @@
+#!/bin/sh
+# Check that `bril2json -j` matches the serial parser. The test file is
+# a function named FUNC, which is repeated (renamed f0, f1, ...) until
+# the program is big enough to be split between processes. With the
+# argument `broken`, a function with a syntax error goes in the middle,
+# and the error messages from the two parsers are compared instead.
+
+export PYTHONHASHSEED=0  # Lark lists expected tokens in set order.
+tmp=$(mktemp -d)
+python3 - "$1" "$2" > "$tmp/big.bril" <<'PY'
+import sys
+template = open(sys.argv[1]).read()
+for i in range(400):
+    if i == 200 and sys.argv[2] == 'broken':
+        print('broken {\n  x: int = ;\n}')
+    print(template.replace('FUNC', 'f{}'.format(i)))
+PY
+
+# Every piece should parse on its own, except the broken one. (The
+# parallel parser falls back to the serial one, so the output alone does
+# not show this.)
+python3 -c '
+import sys
+from briltxt.parse import split_funcs, _parse_chunk
+parsed = [_parse_chunk(p) for p in split_funcs(sys.stdin.read(), 12)]
+good = [p for p in parsed if p is not None]
+print("pieces:", len(parsed))
+print("pieces that parse:", len(good))
+print("functions:", sum(len(p) for p in good))
+' < "$tmp/big.bril"
+
+bril2json < "$tmp/big.bril" > "$tmp/serial.json" 2> "$tmp/serial.err"
+echo "serial status: $?"
+bril2json -j 3 < "$tmp/big.bril" > "$tmp/jobs.json" 2> "$tmp/jobs.err"
+echo "parallel status: $?"
+
+cmp -s "$tmp/serial.json" "$tmp/jobs.json" && echo "same output"
+for f in serial jobs; do
+    sed -n '/^lark\.exceptions/,$p' "$tmp/$f.err" > "$tmp/$f.msg"
+done
+if [ -s "$tmp/serial.msg" ]; then
+    head -n 1 "$tmp/serial.msg"
+    cmp -s "$tmp/serial.msg" "$tmp/jobs.msg" && echo "same error"
+fi
+rm -rf "$tmp"